@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import yaml
+from PIL import Image
+
+FONT_DIR = Path(__file__).resolve().parent.parent / 'font'
+STANDARDS = ('simple', 'g2', 'g2_no_border', 'g19')
+
+WORDS = ('измерение', 'модуль', 'сигнал', 'канал', 'проверка', 'результат', 'значение', 'режим', 'устройство',
+         'интерфейс', 'питание', 'температура', 'контроль', 'протокол', 'данные', 'ошибка', 'порог', 'опрос')
+COLORS = ('', 'yellow', 'green', 'darkgreen')
+
+
+class Size:
+    # chapters of a project, each with its tables, images and a list nested list_depth levels deep
+    def __init__(self, chapters, tables, rows, images, list_depth, paragraphs=4, appendixes=1):
+        self.chapters = chapters
+        self.tables = tables
+        self.rows = rows
+        self.images = images
+        self.list_depth = list_depth
+        self.paragraphs = paragraphs
+        self.appendixes = appendixes
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+SIZES = {
+    'small': Size(chapters=2, tables=1, rows=20, images=1, list_depth=2),
+    'medium': Size(chapters=20, tables=2, rows=200, images=2, list_depth=3),
+    'large': Size(chapters=60, tables=3, rows=2000, images=3, list_depth=3),
+}
+
+
+def _text(seed, words):
+    # the same seed gives the same text, so runs on different commits lay out the same document
+    return ' '.join(WORDS[(seed * 7 + i * 5) % len(WORDS)] for i in range(words)).capitalize() + '.'
+
+
+def _list(lines, depth, level, seed):
+    indent = '   ' * level
+    for index in range(3):
+        lines.append(f'{indent}{index + 1}. {_text(seed + index, 6)}')
+        if level + 1 < depth and index == 0:
+            _list(lines, depth, level + 1, seed + 1)
+
+
+def _chapter(number, size):
+    lines = [f'# Раздел {number} %label(chapter{number})', '']
+    for index in range(size.paragraphs):
+        lines += [_text(number * 31 + index, 40 + index * 10), '']
+    refs = [f'таблицу %ref(table{number}_{index + 1})' for index in range(size.tables)]
+    refs += [f'рисунок %ref(image{number}_{index + 1})' for index in range(size.images)]
+    if number > 1:
+        refs.append(f'раздел %ref(chapter{number - 1})')
+    if refs:
+        lines += [f'См. {", ".join(refs)}.', '']
+    lines += [f'## Проверки раздела {number}', '']
+    _list(lines, size.list_depth, 0, number)
+    lines += ['', '| Параметр | Значение | Единица |', '|---|---|---|']
+    lines += [f'| {WORDS[(number + i) % len(WORDS)]} | {number * 10 + i} | мВ |' for i in range(5)]
+    lines += ['', f': Параметры раздела {number}', '']
+    return '\n'.join(lines)
+
+
+def _table(number, index, rows):
+    data = []
+    for row in range(rows):
+        group = row // 3
+        data.append([str(row + 1), COLORS[group % len(COLORS)], f'Группа {group + 1}', _text(row + index, 3 + row % 5)])
+    return {
+        'header': f'Результаты {number}.{index} %label(table{number}_{index})',
+        'columns': [['№', 'Состояние', 'Группа', 'Описание']],
+        'formats': ['', 'color', 'span', ''],
+        'span': [],
+        'data': data,
+    }
+
+
+def _image(filename, seed):
+    # a smooth picture bigger than the page, so it goes through the resampling
+    gradient = Image.linear_gradient('L').resize((1600, 1000))
+    blue = Image.new('L', gradient.size, seed * 37 % 256)
+    Image.merge('RGB', (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), blue)).save(filename)
+
+
+def _title():
+    return {
+        'company': 'ЗАО «Пример»',
+        'caption': 'ПРОТОКОЛ ИСПЫТАНИЙ\nСинтетический документ',
+        'doc_type': 'РП 000 00',
+        'approve': 'ИМЕС.00000-00 00-ЛУ',
+        'agrees': [
+            {'name': 'И.И. Иванов', 'job_name': 'Руководитель отдела'},
+            {'name': 'П.П. Петров', 'job_name': 'Руководитель проекта'},
+        ],
+    }
+
+
+def generate(directory, standard, size):
+    # writes a project for the standard into directory and returns the name of its yaml file
+    os.makedirs(directory, exist_ok=True)
+    fonts = []
+    for name, kind in (('Times New Roman', 'normal'), ('Times New Roman Bold', 'bold'),
+                       ('Times New Roman Italic', 'italic')):
+        filename = f'{name}.ttf'
+        if not os.path.exists(os.path.join(directory, filename)):
+            shutil.copy(FONT_DIR / filename, directory)
+        fonts.append({'name': name, 'filename': filename, 'type': kind})
+
+    items = []
+    for number in range(1, size.chapters + 1):
+        name = f'chapter{number}.md'
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+            file.write(_chapter(number, size))
+        items.append({'type': 'markdown', 'name': name})
+        for index in range(1, size.tables + 1):
+            name = f'table{number}_{index}.json'
+            with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+                json.dump(_table(number, index, size.rows), file, ensure_ascii=False)
+            items.append({'type': 'table', 'name': name, 'ref': f'table{number}_{index}'})
+        for index in range(1, size.images + 1):
+            name = f'image{number}_{index}.png'
+            if not os.path.exists(os.path.join(directory, name)):
+                _image(os.path.join(directory, name), number * 10 + index)
+            items.append({'type': 'image', 'name': name, 'caption': f'Рисунок раздела {number}',
+                          'ref': f'image{number}_{index}'})
+
+    appendixes = []
+    for number in range(1, size.appendixes + 1):
+        name = f'appendix{number}.md'
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+            file.write(_chapter(size.chapters + number, Size(1, 0, 0, 0, size.list_depth, size.paragraphs)))
+        appendixes.append({'caption': f'Дополнительные данные {number}', 'type': 'справочное',
+                           'items': [{'type': 'markdown', 'name': name}]})
+
+    project = {'spc': {
+        'config': {
+            'standard': standard,
+            'output': f'out_{standard}.pdf',
+            'font': {'family': 'Times New Roman', 'size': 12, 'fonts': fonts},
+            'table_of_content': 'Содержание',
+        },
+        'title': _title(),
+        'items': items,
+        'appendixes': appendixes,
+    }}
+    filename = os.path.join(directory, f'{standard}.yaml')
+    with open(filename, 'w', encoding='utf-8') as file:
+        yaml.safe_dump(project, file, allow_unicode=True, sort_keys=False)
+    return filename
@@ -0,0 +1,146 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.generate import SIZES, STANDARDS, generate
+
+
+def build(filename, cache, jobs=None):
+    # runs in its own process, so the peak RSS belongs to this build alone
+    if not cache:
+        os.environ['SPC_CACHE_DIR'] = ''
+    from spc import SimplePDFCreate
+
+    phases = {}
+
+    def on_event(event):
+        if event.kind == 'phase_end':
+            phases[event.name] = phases.get(event.name, 0.0) + event.elapsed
+
+    start = time.perf_counter()
+    doc = SimplePDFCreate(on_event).load(filename)
+    doc.save(jobs)
+    elapsed = time.perf_counter() - start
+    # kilobytes on linux, bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+    return {
+        'elapsed': elapsed,
+        'phases': phases,
+        'passes': doc.passes,
+        'pages': doc.page_count,
+        'peak_rss_mb': peak_rss,
+        'output_bytes': os.path.getsize(doc.filename),
+    }
+
+
+def run_case(filename, cache=False, jobs=None):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(build, filename, cache, jobs).result()
+
+
+def import_time(repeat=5):
+    # startup of a fresh interpreter importing spc, the best of several runs
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import spc'], check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(standards, sizes, repeat=1, directory=None, cache=False, on_result=None, jobs=None):
+    results = []
+    with tempfile.TemporaryDirectory(prefix='spc-bench-') as temp:
+        for size_name in sizes:
+            project_dir = os.path.join(directory or temp, size_name)
+            for standard in standards:
+                filename = generate(project_dir, standard, SIZES[size_name])
+                for attempt in range(repeat):
+                    result = {'standard': standard, 'size': size_name, 'attempt': attempt}
+                    result.update(run_case(filename, cache, jobs))
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sizes': {name: SIZES[name].as_dict() for name in sizes},
+        'import_time': import_time(),
+        'jobs': jobs,
+        'results': results,
+    }
+
+
+def _best(report):
+    # the fastest attempt of each case is compared, the others are noise
+    best = {}
+    for result in report['results']:
+        key = (result['standard'], result['size'])
+        if key not in best or result['elapsed'] < best[key]['elapsed']:
+            best[key] = result
+    return best
+
+
+def compare(old, new):
+    old_best = _best(old)
+    lines = []
+    if 'import_time' in old and 'import_time' in new:
+        lines.append(f'{"import":>19}: {old["import_time"]:8.2f}s -> {new["import_time"]:8.2f}s '
+                     f'({new["import_time"] / old["import_time"]:5.2f}x)')
+    for key, result in _best(new).items():
+        if key not in old_best:
+            continue
+        before = old_best[key]
+        ratio = result['elapsed'] / before['elapsed']
+        lines.append(f'{key[0]:>12} {key[1]:>6}: '
+                     f'{before["elapsed"]:8.2f}s -> {result["elapsed"]:8.2f}s ({ratio:5.2f}x), '
+                     f'rss {before["peak_rss_mb"]:.0f} -> {result["peak_rss_mb"]:.0f} MB, '
+                     f'size {before["output_bytes"]} -> {result["output_bytes"]}')
+    return lines
+
+
+def print_result(result):
+    phases = ', '.join(f'{name} {elapsed:.2f}s' for name, elapsed in result['phases'].items())
+    print(f'{result["standard"]:>12} {result["size"]:>6}: {result["elapsed"]:.2f}s, {result["pages"]} pages, '
+          f'{result["passes"]} passes, {result["peak_rss_mb"]:.0f} MB, {result["output_bytes"]} bytes ({phases})',
+          flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--standard', nargs='+', choices=STANDARDS, default=list(STANDARDS))
+    parser.add_argument('--size', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=1, help="builds of every project")
+    parser.add_argument('--output', type=str, default=None, help="save results to json file")
+    parser.add_argument('--compare', type=str, default=None, help="compare with results saved before")
+    parser.add_argument('--directory', type=str, default=None, help="keep generated projects there")
+    parser.add_argument('--cache', action='store_true', help="use the disk cache, builds are cold without it")
+    parser.add_argument('--jobs', type=int, default=None, help="lay out the segments of a document in processes")
+    args = parser.parse_args()
+
+    report = run(args.standard, args.size, args.repeat, args.directory, args.cache, print_result, args.jobs)
+    print(f'import spc: {report["import_time"]:.2f}s')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            print('\n'.join(compare(json.load(file), report)))
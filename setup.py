@@ -1,11 +1,16 @@
+import re
+
 from setuptools import setup, find_packages
 
+with open('spc/__init__.py', encoding='utf-8') as file:
+    version = re.search(r"__version__ = '(.+)'", file.read()).group(1)
 
 setup(
     name="spc",
-    version="0.3.0",
+    version=version,
     description="Simple PDF create",
-    packages=find_packages(),
-    install_requires=["reportlab", "mistletoe"],
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*', 'tests', 'tests.*')),
+    install_requires=["reportlab>=5.0,<5.1", "mistletoe", "Pillow"],
+    extras_require={"parallel": ["pypdf"]},
     entry_points={"console_scripts": ["realpython=reader.__main__:main"]}
 )
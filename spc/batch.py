@@ -0,0 +1,76 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from spc.core import SimplePDFCreate
+
+
+class BuildResult:
+    def __init__(self, filename, output=None, pages=0, elapsed=0.0, error=None):
+        self.filename = filename
+        self.output = output
+        self.pages = pages
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def expand_projects(patterns):
+    result = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        # keep a pattern without matches, so it shows up as a failed document
+        for filename in matches or [pattern]:
+            filename = os.path.normpath(filename)
+            if filename not in result:
+                result.append(filename)
+    return result
+
+
+def build_project(filename):
+    start = time.perf_counter()
+    try:
+        doc = SimplePDFCreate().load(filename)
+        doc.save()
+    except Exception as e:
+        return BuildResult(filename, elapsed=time.perf_counter() - start, error=f'{e.__class__.__name__}: {e}')
+    return BuildResult(filename, doc.filename, doc.page, time.perf_counter() - start)
+
+
+def build_memory(project, files):
+    # the project text and its files in memory, returns the result and the pdf
+    start = time.perf_counter()
+    try:
+        doc = SimplePDFCreate().loads(project, files)
+        pdf = doc.save_bytes()
+    except Exception as e:
+        return BuildResult(None, elapsed=time.perf_counter() - start, error=f'{e.__class__.__name__}: {e}'), None
+    return BuildResult(None, None, doc.page, time.perf_counter() - start), pdf
+
+
+def build_batch(filenames, jobs=None, on_result=None):
+    results = {}
+    if jobs == 1:
+        for filename in filenames:
+            results[filename] = build_project(filename)
+            if on_result:
+                on_result(results[filename])
+        return [results[filename] for filename in filenames]
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(build_project, filename): filename for filename in filenames}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker process itself died, the other documents are still built
+                result = BuildResult(filename, error=f'{e.__class__.__name__}: {e}')
+            results[filename] = result
+            if on_result:
+                on_result(result)
+    return [results[filename] for filename in filenames]
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+
+def cache_dir():
+    # SPC_CACHE_DIR="" disables every on-disk cache
+    path = os.environ.get('SPC_CACHE_DIR')
+    if path is None:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        path = os.path.join(base, 'spc')
+    return path or None
+
+
+def clear_cache():
+    # nothing is evicted by itself, this removes all spc keeps on disk, with what older versions left there
+    path = cache_dir()
+    if path and os.path.isdir(path):
+        shutil.rmtree(path)
+    return path
+
+
+def make_key(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def file_hash(filename):
+    if isinstance(filename, bytes):
+        # the content of a file given in memory
+        return hashlib.sha1(filename).hexdigest()
+    if not isinstance(filename, (str, os.PathLike)):
+        # open would take an int for a file descriptor
+        raise TypeError(f'a file name or bytes expected, not {filename.__class__.__name__}')
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    def __init__(self, namespace, directory=None):
+        directory = directory or cache_dir()
+        self.__directory = os.path.join(directory, namespace) if directory else None
+
+    @property
+    def enabled(self):
+        return self.__directory is not None
+
+    def path(self, key):
+        return os.path.join(self.__directory, f'{key}.pickle')
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        try:
+            with open(self.path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return default
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        # the cache is only an optimization, a read-only home must not break a build
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.__directory, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
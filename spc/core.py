@@ -1,136 +1,252 @@
-import json
+import importlib
+import pickle
+import re
+from collections import OrderedDict
 from pathlib import Path
-from typing import Literal
+from typing import Literal, TYPE_CHECKING
 
-import mistletoe
 import yaml
 
-from pydantic_yaml import parse_yaml_raw_as, to_yaml_str
-from json_schema_for_humans.generate import generate_from_filename
-from json_schema_for_humans.generation_configuration import GenerationConfiguration
-
+from spc import __version__
+from spc.cache import DiskCache, file_hash, make_key
+from spc.events import Events
+from spc.json_stream import load_object
+from spc.sources import ProjectFiles, open_text
 from spc.spc_yaml import SPC, SPCMain, TitleApprove
-from spc.standard.doc import SPCParagraph, SPCChapter, SPCList, SPCTable, SPCAppendix, \
-    SPCPagebreak, SPCImage
-from spc.standard.g105 import G105Doc
-from spc.standard.g105_no_border import G105NoBorderDoc, G105Chapter, G105Table, G105Title, G105List, G105Image
-from spc.standard.g19 import G19, G19Chapter, G19Title, G19List, G19Image, G19Specification, G19NotificationSheet
-from spc.standard.simple import SimpleDoc, SimpleTitle
+from spc.standard.doc import SPCParagraph, SPCChapter, SPCTable, SPCAppendix, SPCPagebreak, SPCImage, SPCItem
+
+if TYPE_CHECKING:
+    import mistletoe
+
+# classes of every standard as 'module:class', a module is imported when a project selects its standard
+STANDARDS = {
+    'g19': {
+        'doc': 'spc.standard.g19:G19',
+        'title': 'spc.standard.g19:G19Title',
+        'notification': 'spc.standard.g19:G19NotificationSheet',
+        'chapter': 'spc.standard.g19:G19Chapter',
+        'image': 'spc.standard.g19:G19Image',
+        'list': 'spc.standard.g19:G19List',
+        'table': 'spc.standard.g105_no_border:G105Table',
+        'specification': 'spc.standard.g19:G19Specification'
+    },
+    'g2': {
+        'doc': 'spc.standard.g105:G105Doc',
+        'title': 'spc.standard.g105_no_border:G105Title',
+        'chapter': 'spc.standard.g105_no_border:G105Chapter',
+        'image': 'spc.standard.g105_no_border:G105Image',
+        'list': 'spc.standard.g105_no_border:G105List',
+        'table': 'spc.standard.g105_no_border:G105Table',
+        'specification': 'spc.standard.g19:G19Specification'
+    },
+    'g2_no_border': {
+        'doc': 'spc.standard.g105_no_border:G105NoBorderDoc',
+        'title': 'spc.standard.g105_no_border:G105Title',
+        'chapter': 'spc.standard.g105_no_border:G105Chapter',
+        'image': 'spc.standard.g105_no_border:G105Image',
+        'list': 'spc.standard.g105_no_border:G105List',
+        'table': 'spc.standard.g105_no_border:G105Table',
+        'specification': 'spc.standard.g19:G19Specification'
+    },
+    'simple': {
+        'doc': 'spc.standard.simple:SimpleDoc',
+        'title': 'spc.standard.simple:SimpleTitle',
+        'image': 'spc.standard.doc:SPCImage',
+        'list': 'spc.standard.simple:SimpleList',
+        'table': 'spc.standard.simple:SimpleTable'
+    }
+}
+
+
+class StandardClasses(dict):
+    # values are class paths until they are looked up, a class put in directly is used as it is
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, str):
+            module, name = value.split(':')
+            value = getattr(importlib.import_module(module), name)
+            self[key] = value
+        return value
+
+    def load(self):
+        for key in self:
+            self[key] = self[key]
+        return self
+
+
+def preload():
+    # imports everything a build may need, for processes that are started before they get a project
+    import mistletoe  # noqa: F401
+    for classes in STANDARDS.values():
+        StandardClasses(classes).load()
+
+
+MARKDOWN_HEADING = re.compile(r'#{1,6}(\s|$)')
+MARKDOWN_FENCE = re.compile(r' {0,3}(```|~~~)')
+
+
+def _markdown_chunks(filename):
+    import mistletoe
+    # the file is parsed heading by heading, so only one chapter of the markdown tree is alive
+    with open_text(filename) as file:
+        lines = []
+        fence = None
+        for line in file:
+            match = MARKDOWN_FENCE.match(line)
+            if match:
+                if fence is None:
+                    fence = match.group(1)
+                elif match.group(1) == fence:
+                    fence = None
+            elif fence is None and lines and MARKDOWN_HEADING.match(line):
+                yield mistletoe.Document(lines)
+                lines = []
+            lines.append(line)
+        if lines:
+            yield mistletoe.Document(lines)
+
+
+# converted items of unchanged sources are reused by every load in this process
+CONVERTED_CACHE_SIZE = 256
+_converted = OrderedDict()
+# sources whose converted items are kept on disk as well, a json table reads its rows from the file
+PERSISTED_KINDS = ('markdown', 'specification')
+
+# the C loader of libyaml, when pyyaml is built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# validated projects by the hash of their yaml, a process building the same project again
+# skips parsing and validation. Every caller gets its own copy of the model
+PROJECT_CACHE_SIZE = 32
+_projects = OrderedDict()
+
+
+def parse_project(content):
+    # content is the yaml text or its bytes
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    key = file_hash(content)
+    spc = _projects.get(key)
+    if spc is None:
+        spc = SPC(**yaml.load(content, Loader=YAML_LOADER)['spc'])
+        _projects[key] = spc
+        if len(_projects) > PROJECT_CACHE_SIZE:
+            _projects.popitem(last=False)
+    else:
+        _projects.move_to_end(key)
+    return spc.copy(deep=True)
 
 
 class SimplePDFCreate:
-    def __init__(self):
+    def __init__(self, on_event=None):
+        # on_event(event) gets the phases, passes, pages and item timings of load and save
+        self.__events = Events(on_event)
         self.__standard = ''
         self.__chapter_count = 0
         self.__table_count = 0
         self.__image_count = 0
         self.__doc = None
-        self.__path = '.'
-
-        self.standards = {
-            'g19': {
-                'doc': G19,
-                'title': G19Title,
-                'chapter': G19Chapter,
-                'image': G19Image,
-                'table': G105Table
-            },
-            'g2': {
-                'doc': G105Doc,
-                'title': G105Title,
-                'chapter': G105Chapter,
-                'image': G105Image,
-                'table': G105Table
-            },
-            'g2_no_border': {
-                'doc': G105NoBorderDoc,
-                'title': G105Title,
-                'chapter': G105Chapter,
-                'image': G105Image,
-                'table': G105Table
-            },
-            'simple': {
-                'doc': SimpleDoc,
-                'title': SimpleTitle,
-            }
-        }
+        self.__files = ProjectFiles()
+        self.__converted_cache = DiskCache('converted')
+
+        self.standards = {name: StandardClasses(classes) for name, classes in STANDARDS.items()}
 
     def print_scheme(self):
+        # only needed to document the project format
+        from json_schema_for_humans.generate import generate_from_filename
+
         with open('schema.json', 'w') as file:
             file.write(SPCMain.schema_json(indent=4))
-        # config = GenerationConfiguration()
         generate_from_filename('schema.json', 'html/schema.html')
         # print(SPC.schema_json())
 
     def load(self, filename):
-        print(f'open project {filename}')
-        with open(filename, 'r', encoding='utf-8') as file:
-            path = Path(filename)
-            self.__path = path.parent
-            data = yaml.safe_load(file)
-            print(f'process')
-            spc = SPC(**data['spc'])
-            fonts = {}
-            font_family = {spc.config.font.family: {}}
-            for item in spc.config.font.fonts:
-                fonts[item.name] = f'{path.parent}/{item.filename}'
-                font_family[spc.config.font.family][item.type] = item.name
-            self.__standard = spc.config.standard
-
-            print(f'create document')
-            doc = self.create_document(f'{self.__path}/{spc.config.output}', fonts, font_family,
-                                       spc.config.standard, spc.config.debug)
-            doc.set_font(spc.config.font.family)
-            doc.set_font_size(spc.config.font.size)
-            self.__doc = doc
-
-            title = self.standards[self.__standard]['title']
-            if spc.config.standard == 'simple':
-                doc.append(title(spc.title.caption))
-            elif spc.config.standard == 'g19':
-                if isinstance(spc.title.approve, TitleApprove):
-                    doc.append(G19NotificationSheet(spc.title.company, spc.title.caption,
-                                 spc.title.doc_type, spc.title.approve, spc.title.agrees))
-                    return doc
-                doc.append(title(spc.title.company, spc.title.caption,
-                                 spc.title.doc_type, spc.title.approve))
-            else:
-                doc.append(title(spc.title.company, spc.title.caption,
-                                 spc.title.doc_type, spc.title.approve, spc.title.agrees))
+        with self.__events.phase('project', filename=filename):
+            with open(filename, 'rb') as file:
+                spc = parse_project(file.read())
+            path = Path(filename).parent
+            doc, spc = self.__load_project(spc, ProjectFiles(path), path)
+        return self.__load_items(doc, spc)
+
+    def loads(self, project, resolver=None):
+        # project is the yaml text or the dict it is parsed to. The files it refers to come from
+        # resolver(name) -> bytes or a dict of them, without it they are relative to the working directory
+        with self.__events.phase('project', filename=None):
+            spc = SPC(**project['spc']) if isinstance(project, dict) else parse_project(project)
+            doc, spc = self.__load_project(spc, ProjectFiles(resolver=resolver), None)
+        return self.__load_items(doc, spc)
+
+    def __load_items(self, doc, spc):
+        if spc is None:
+            return doc
+
+        for item in self.__iter_items(spc):
+            doc.append(item)
+        return doc
+
+    def __load_project(self, spc, files, path):
+        # the output goes next to the project file, a project from memory has no place of its own
+        self.__files = files
+        fonts = {}
+        font_family = {spc.config.font.family: {}}
+        for item in spc.config.font.fonts:
+            fonts[item.name] = files(item.filename)
+            font_family[spc.config.font.family][item.type] = item.name
+        self.__standard = spc.config.standard
+
+        output = spc.config.output if path is None else f'{path}/{spc.config.output}'
+        doc = self.create_document(output, fonts, font_family, spc.config.standard, spc.config.debug)
+        doc.events = self.__events
+        doc.set_font(spc.config.font.family)
+        doc.set_font_size(spc.config.font.size)
+        self.__doc = doc
+
+        title = self.standards[self.__standard]['title']
+        if spc.config.standard == 'simple':
+            doc.append(title(spc.title.caption))
+        elif spc.config.standard == 'g19':
+            if isinstance(spc.title.approve, TitleApprove):
+                doc.append(self.standards['g19']['notification'](spc.title.company, spc.title.caption,
+                             spc.title.doc_type, spc.title.approve, spc.title.agrees))
+                return doc, None
+            doc.append(title(spc.title.company, spc.title.caption,
+                             spc.title.doc_type, spc.title.approve))
+        else:
+            doc.append(title(spc.title.company, spc.title.caption,
+                             spc.title.doc_type, spc.title.approve, spc.title.agrees))
 
-            if len(spc.config.table_of_content):
-                doc.set_table_of_content(spc.config.table_of_content)
+        if len(spc.config.table_of_content):
+            doc.set_table_of_content(spc.config.table_of_content)
+        return doc, spc
 
-            print(f'process items')
+    def __iter_items(self, spc: SPC):
+        # items are produced in document order, the numbers of a source run on from the items before
+        with self.__events.phase('items'):
             for item in spc.items:
-                full_path = f'{self.__path}/{item.name}'
+                full_path = self.__files(item.name)
                 if item.type == 'image':
                     image = self.standards[self.__standard]['image'](caption=item.caption, filename=full_path,
                                                                      reference=item.ref,
                                                                      image_index=self.__image_count+1)
                     self.__image_count += 1
-                    doc.append(image)
+                    yield image
                 elif item.type == 'markdown':
-                    _items = self.__load_markdown(full_path)
-                    for _item in _items:
-                        doc.append(_item)
+                    yield from self.__convert('markdown', full_path, self.__iter_markdown)
                 elif item.type == 'table':
-                    doc.append(self.__load_json_table(full_path))
+                    yield from self.__convert('table', full_path, self.__load_json_table)
                 elif item.type == 'specification':
-                    _items= self.__load_specification(full_path)
-                    for _item in _items:
-                        doc.append(_item)
+                    yield from self.__convert('specification', full_path, self.__load_specification)
                 else:
                     raise Exception(f'unknown type {item.type}')
 
-            doc.append(SPCPagebreak())
+        yield SPCPagebreak()
 
-            print(f'process appendixes')
+        with self.__events.phase('appendixes'):
             for index, item in enumerate(spc.appendixes):
                 appendix_name = ''
                 self.__table_count = 0
                 if self.__standard == 'simple':
-                    doc.append(SPCAppendix(appendix_name, item.caption, 'справочное'))
+                    yield SPCAppendix(appendix_name, item.caption, 'справочное')
                 else:
                     letters = 'АБВГДЕЖИКЛМНПРСТУФХЦШЩЭЮЯ'
                     if index > len(letters):
@@ -138,56 +254,101 @@ class SimplePDFCreate:
                     else:
                         appendix_name = letters[index]
                     name = f'Приложение {appendix_name}'
-                    doc.append(SPCAppendix(name, item.caption, item.type))
+                    yield SPCAppendix(name, item.caption, item.type, appendix_name)
                 for app_item in item.items:
                     if app_item.type == 'image':
-                        doc.append(SPCImage(caption='', filename=app_item.name, reference='', image_index=0))
+                        yield SPCImage(caption='', filename=self.__files(app_item.name), reference='', image_index=0)
                     elif app_item.type == 'markdown':
-                        _items = self.__load_markdown(f'{self.__path}/{app_item.name}')
+                        _items = self.__convert('markdown', self.__files(app_item.name), self.__iter_markdown)
                         for _item in _items:
                             if self.__standard != 'simple':
                                 if isinstance(_item, SPCChapter):
                                     _item.text = f'{appendix_name}.{_item.text}'
-                                elif isinstance(_item, G105Table):
+                                    if _item.number is not None:
+                                        _item.number = f'{appendix_name}.{_item.number}'
+                                elif isinstance(_item, SPCTable):
                                     _item.table_index = f'{appendix_name}.{_item.table_index}'
-                            doc.append(_item)
+                            yield _item
                     elif app_item.type == 'table':
-                        table = self.__load_json_table(app_item.name)
-                        table.table_index = f'{appendix_name}.{table.table_index}'
-                        doc.append(table)
-                doc.append(SPCPagebreak())
-            return doc
+                        for table in self.__convert('table', self.__files(app_item.name), self.__load_json_table):
+                            table.table_index = f'{appendix_name}.{table.table_index}'
+                            yield table
+                yield SPCPagebreak()
+
+    def __place(self, item, filename, tables, images):
+        # the numbers in a converted source start from zero and its images keep the names
+        # from the markdown, both are set for the place where the source is used. The streamed
+        # rows of a table are read from the file of this project, not the one first cached
+        if isinstance(item, SPCTable):
+            if isinstance(item.table_index, int):
+                item.table_index += tables
+            item.set_source(filename)
+        elif isinstance(item, SPCImage):
+            item.image_index += images
+            item.filename = self.__files(item.filename)
+        return item
+
+    def __convert(self, kind, filename, loader):
+        # the converted items of a source do not depend on where it is used, so they are shared
+        # by every document including it and kept on disk between runs
+        key = make_key(kind, file_hash(filename), self.__standard, __version__)
+        tables, images, chapters = self.__table_count, self.__image_count, self.__chapter_count
+        cached = _converted.get(key)
+        if cached is None and kind in PERSISTED_KINDS:
+            cached = self.__converted_cache.get(key)
+        if cached is None:
+            self.__table_count = self.__image_count = self.__chapter_count = 0
+            items = loader(filename)
+            items = [items] if isinstance(items, SPCItem) else list(items)
+            cached = (pickle.dumps(items), self.__table_count, self.__image_count, self.__chapter_count)
+            if kind in PERSISTED_KINDS:
+                self.__converted_cache.set(key, cached)
+        else:
+            # the document changes its items, every load gets its own copy
+            items = pickle.loads(cached[0])
+            for item in items:
+                item.bind(self.__doc.on_replace)
+        _converted[key] = cached
+        _converted.move_to_end(key)
+        if len(_converted) > CONVERTED_CACHE_SIZE:
+            _converted.popitem(last=False)
+        self.__table_count = tables + cached[1]
+        self.__image_count = images + cached[2]
+        self.__chapter_count = chapters + cached[3]
+        for item in items:
+            self.__place(item, filename, tables, images)
+        return items
 
     def __load_json_table(self, filename):
-        with open(filename, 'r') as fp:
-            json_data = json.load(fp)
-            header = json_data['header']
-            formats = json_data['formats']
-            columns = json_data['columns']
-            if len(formats) != len(columns):
-                if isinstance(columns[0], list):
-                    for column in columns:
-                        if len(formats) != len(column):
-                            raise Exception(f'formats and columns{column} must be same size!')
-                else:
-                    raise Exception(f'formats and columns must be same size!')
-            table = self.standards[self.__standard]['table'](None, formats, self.__table_count+1)
-            self.__table_count += 1
-            table.set_caption(header)
-            for span in json_data['span']:
-                start = span['start']
-                end = span['end']
-                table.append_span(start, end)
-            for column in columns:
-                if isinstance(column, list):
-                    table.append(column)
-                else:
-                    table.append(column)
-            for row in json_data['data']:
-                table.append(row)
-            return table
+        # the data rows are streamed from the file, only the description is loaded here
+        json_data = load_object(filename, streamed=('data',))
+        header = json_data['header']
+        formats = json_data['formats']
+        columns = json_data['columns']
+        if len(formats) != len(columns):
+            if isinstance(columns[0], list):
+                for column in columns:
+                    if len(formats) != len(column):
+                        raise Exception(f'formats and columns{column} must be same size!')
+            else:
+                raise Exception(f'formats and columns must be same size!')
+        table = self.standards[self.__standard]['table'](None, formats, self.__table_count+1)
+        self.__table_count += 1
+        table.set_caption(header)
+        for span in json_data['span']:
+            start = span['start']
+            end = span['end']
+            table.append_span(start, end)
+        for column in columns:
+            if isinstance(column, list):
+                table.append(column)
+            else:
+                table.append(column)
+        table.extend(json_data['data'])
+        return table
 
-    def __load_paragraph(self, parent: mistletoe.block_token.Paragraph):
+    def __load_paragraph(self, parent: 'mistletoe.block_token.Paragraph'):
+        import mistletoe
         text = ''
         result = []
         for child in parent.children:
@@ -219,7 +380,7 @@ class SimplePDFCreate:
                 result.append(SPCParagraph(text, self.__doc.on_replace))
                 text = ''
                 reference = child.children[0].content if len(child.children) else '_'
-                image = self.standards[self.__standard]['image'](child.title, f'{self.__path}/{child.src}',
+                image = self.standards[self.__standard]['image'](child.title, child.src,
                                                                  reference, self.__image_count+1)
                 self.__image_count += 1
                 result.append(image)
@@ -228,13 +389,13 @@ class SimplePDFCreate:
         result.append(SPCParagraph(text, self.__doc.on_replace))
         return result
 
-    def __load_list(self, parent: mistletoe.block_token.List, sub_list=0):
-        if self.__standard == 'simple':
-            result = SPCList(parent.start)
-        elif self.__standard == 'g19':
-            result = G19List(parent.start, self.__doc.on_replace)
+    def __load_list(self, parent: 'mistletoe.block_token.List', sub_list=0):
+        import mistletoe
+        list_class = self.standards[self.__standard]['list']
+        if self.__standard == 'g19':
+            result = list_class(parent.start, self.__doc.on_replace)
         else:
-            result = G105List(parent.start, sub_list)
+            result = list_class(parent.start, sub_list)
         for child in parent.children:
             child: mistletoe.block_token.ListItem
             for item in child.children:
@@ -245,16 +406,13 @@ class SimplePDFCreate:
                     result.append(self.__load_list(item, sub_list + 1))
         return result
 
-    def __load_table(self, parent: mistletoe.block_token.Table, is_specification=False):
+    def __load_table(self, parent: 'mistletoe.block_token.Table', is_specification=False):
         header = [h.children[0].content for h in parent.header.children]
         columns = ['str' for _i in parent.header.children]
-        if self.__standard == 'simple':
-            table = SPCTable(header, self.__table_count+1, columns)
+        if is_specification and self.__standard != 'simple':
+            table = self.standards[self.__standard]['specification']()
         else:
-            if is_specification:
-                table = G19Specification()
-            else:
-                table = G105Table(header, columns, self.__table_count+1)
+            table = self.standards[self.__standard]['table'](header, columns, self.__table_count+1)
         self.__table_count = self.__table_count + 1
         for row in parent.children:
             items = [v.children[0].content if len(v.children) else '' for v in row.children]
@@ -262,23 +420,27 @@ class SimplePDFCreate:
         return table
 
     def __load_specification(self, filename):
+        import mistletoe
         items = []
-        with open(filename, 'r', encoding='utf-8') as file:
+        with open_text(filename) as file:
             md_doc = mistletoe.Document(file)
             for child in md_doc.children:
                 if isinstance(child, mistletoe.block_token.Table):
                     table = self.__load_table(child, True)
                     items.append(table)
-                print(child)
         return items
 
-    def __load_markdown(self, filename):
-        items = []
+    def __iter_markdown(self, filename):
+        import mistletoe
         chapters = {}
         table = None
-        with open(filename, 'r', encoding='utf-8') as file:
-            md_doc = mistletoe.Document(file)
-            for child in md_doc.children:
+        held = []
+        for md_doc in _markdown_chunks(filename):
+            children = md_doc.children
+            for position, child in enumerate(children):
+                # the converted block is not needed anymore
+                children[position] = None
+                result = []
                 if isinstance(child, mistletoe.block_token.Paragraph):
                     result = self.__load_paragraph(child)
                     if table:
@@ -286,12 +448,10 @@ class SimplePDFCreate:
                             table.set_caption(result[0].text[1:])
                             del result[0]
                             table = None
-                    if len(result):
-                        items += result
                 elif isinstance(child, mistletoe.block_token.Heading):
                     child: mistletoe.block_token.Heading
                     if self.__standard == 'simple':
-                        items.append(SPCChapter(child.level, child.children[0].content))
+                        result.append(SPCChapter(child.level, child.children[0].content))
                     else:
                         if child.level == 1:
                             if child.level not in chapters:
@@ -319,16 +479,22 @@ class SimplePDFCreate:
 
                         chapter = self.standards[self.__standard]['chapter'](child.level,
                                                                              child.children[0].content, index)
-                        items.append(chapter)
+                        result.append(chapter)
                 elif isinstance(child, mistletoe.block_token.List):
-                    result = self.__load_list(child)
-                    items.append(result)
+                    result.append(self.__load_list(child))
                 elif isinstance(child, mistletoe.block_token.Table):
                     table = self.__load_table(child)
-                    items.append(table)
+                    result.append(table)
                 else:
                     raise Exception(child)
-        return items
+                # a table is handed out after the next block, which may hold its caption
+                yield from held
+                held = []
+                if table is not None and result and result[-1] is table:
+                    held = result
+                else:
+                    yield from result
+        yield from held
 
     def create_document(self, filename, font, font_family,
                         standard: Literal['simple', 'g2', 'g2_no_border', 'g19'] = 'simple', debug=False):
@@ -0,0 +1,44 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('spc')
+# a library stays silent unless the application configures logging or passes a callback
+logger.addHandler(logging.NullHandler())
+
+
+class Event:
+    # kind is one of 'phase_start', 'phase_end', 'pass', 'page', 'item', 'segment', 'unresolved'
+    def __init__(self, kind, **data):
+        self.kind = kind
+        self.__dict__.update(data)
+
+    def __repr__(self):
+        data = ', '.join(f'{key}={value!r}' for key, value in self.__dict__.items() if key != 'kind')
+        return f'Event({self.kind}, {data})'
+
+
+class Events:
+    def __init__(self, callback=None):
+        self.callback = callback
+
+    @property
+    def enabled(self):
+        return self.callback is not None or logger.isEnabledFor(logging.DEBUG)
+
+    def emit(self, kind, **data):
+        if not self.enabled:
+            return
+        event = Event(kind, **data)
+        logger.debug('%r', event)
+        if self.callback is not None:
+            self.callback(event)
+
+    @contextmanager
+    def phase(self, name, **data):
+        start = time.perf_counter()
+        self.emit('phase_start', name=name, **data)
+        try:
+            yield
+        finally:
+            self.emit('phase_end', name=name, elapsed=time.perf_counter() - start, **data)
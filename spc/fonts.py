@@ -0,0 +1,76 @@
+import io
+from fnmatch import fnmatch
+from weakref import WeakKeyDictionary
+
+from reportlab import Version as reportlab_version, rl_config
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, TTFontFace, TTEncoding
+
+from spc.cache import DiskCache, file_hash, make_key
+
+# font name -> the content hash of the file registered in this process
+_registered = {}
+
+
+def _cache():
+    # made on every use, SPC_CACHE_DIR may change in a running process
+    return DiskCache('fonts')
+
+
+def _pdf_scale(units_per_em):
+    if units_per_em == 1000:
+        return lambda x: x
+    mult = 1000 / units_per_em
+    return lambda x: x * mult
+
+
+def _dump(font: TTFont):
+    # only the parsed file is kept, what TTFont sets from its arguments is set again for the name it is loaded as
+    face = font.face.__dict__.copy()
+    face.pop('_pdfScale', None)
+    return {'face': face}
+
+
+def _restore(name, state):
+    # the attributes TTFont.__init__ sets with its default arguments. They are private to reportlab,
+    # its version is pinned in setup.py and the round trip is tested against a freshly parsed font
+    face = TTFontFace.__new__(TTFontFace)
+    face.__dict__.update(state['face'])
+    face._pdfScale = _pdf_scale(face.unitsPerEm)
+    font = TTFont.__new__(TTFont)
+    font.fontName = name
+    font.face = face
+    font.encoding = TTEncoding()
+    font.state = WeakKeyDictionary()
+    font._asciiReadable = rl_config.ttfAsciiReadable
+    font.shapable = not any(fnmatch(name, pattern) for pattern in rl_config.unShapedFontGlob)
+    return font
+
+
+def load_font(name, filename):
+    # filename may also be the content of the font file
+    key = make_key(file_hash(filename), reportlab_version)
+    state = _cache().get(key)
+    if state is not None:
+        return _restore(name, state)
+    font = TTFont(name, io.BytesIO(filename) if isinstance(filename, bytes) else filename)
+    _cache().set(key, _dump(font))
+    return font
+
+
+def register_font(name, filename):
+    # a font is known by its content, the same file copied next to another project or given in memory
+    # is not loaded again
+    signature = file_hash(filename)
+    if _registered.get(name) == signature:
+        return pdfmetrics.getFont(name)
+
+    font = load_font(name, filename)
+    if name in _registered:
+        # the file changed since it was registered, reportlab never replaces a registered font by itself
+        old = pdfmetrics._fonts.pop(name, None)
+        if old is not None:
+            pdfmetrics._dynFaceNames.pop(old.face.name, None)
+    pdfmetrics.registerFont(font)
+    _registered[name] = signature
+    return pdfmetrics.getFont(name)
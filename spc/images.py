@@ -0,0 +1,157 @@
+import atexit
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import PIL
+from PIL import Image as PILImage
+
+from spc.cache import cache_dir, file_hash, make_key
+
+# resolution images are resampled to for the size they are placed at
+DPI = 150
+JPEG_QUALITY = 85
+
+_executor = None
+_lock = threading.Lock()
+# the last images used, a server worker builds documents with new images for its whole life
+CACHE_SIZE = 256
+# (path, mtime, size, box) or (content hash, box) -> Future of PreparedImage
+_pending = OrderedDict()
+_temp_dir = None
+
+
+class PreparedImage:
+    def __init__(self, filename, width=None, height=None):
+        # a file name, or the content of an image given or resampled in memory
+        self.filename = filename
+        # placed size in points, None keeps the size of the file
+        self.width = width
+        self.height = height
+
+    @property
+    def source(self):
+        # what reportlab reads the image from
+        return io.BytesIO(self.filename) if isinstance(self.filename, bytes) else self.filename
+
+
+def _remember(cache, key, value):
+    # the value kept for key, value when there is none yet. Called with _lock held
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    cache[key] = value
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def _directory():
+    global _temp_dir
+    directory = cache_dir()
+    if directory:
+        return os.path.join(directory, 'images')
+    # without the disk cache the resampled images live as long as the process
+    if _temp_dir is None:
+        _temp_dir = tempfile.mkdtemp(prefix='spc-images-')
+        atexit.register(shutil.rmtree, _temp_dir, True)
+    return _temp_dir
+
+
+def _write(image, target, file, extension):
+    image.draft('RGB', target)
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode == 'PA' else 'RGB')
+    image = image.resize(target, PILImage.LANCZOS)
+    if extension == '.jpg':
+        image.save(file, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    else:
+        image.save(file, 'PNG', optimize=True)
+
+
+def _save(image, target, path):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            _write(image, target, file, os.path.splitext(path)[1])
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def prepare(filename, box=None, dpi=DPI):
+    # an image is placed at one point per pixel as before, shrunk to fit the box of the largest frame.
+    # The pixels beyond dpi for that size are dropped
+    try:
+        digest = file_hash(filename)
+        with PILImage.open(io.BytesIO(filename) if isinstance(filename, bytes) else filename) as image:
+            width, height = image.size
+            scale = min(1.0, box[0] / width, box[1] / height) if box else 1.0
+            placed = (width * scale, height * scale)
+            target = (max(1, round(placed[0] * dpi / 72)), max(1, round(placed[1] * dpi / 72)))
+            if target[0] >= width:
+                if isinstance(filename, bytes):
+                    return PreparedImage(filename, *placed)
+                # reportlab embeds identical image data of a document once
+                return PreparedImage(os.path.abspath(filename), *placed)
+            extension = '.jpg' if image.format == 'JPEG' and image.mode in ('RGB', 'L', 'CMYK') else '.png'
+            if isinstance(filename, bytes):
+                # an image given in memory is resampled in memory as well
+                file = io.BytesIO()
+                _write(image, target, file, extension)
+                return PreparedImage(file.getvalue(), *placed)
+            path = os.path.join(_directory(), make_key(digest, target, JPEG_QUALITY, PIL.__version__) + extension)
+            if not os.path.exists(path):
+                _save(image, target, path)
+            return PreparedImage(path, *placed)
+    except OSError:
+        # reportlab gets the file as it is and reports what is wrong with it
+        return PreparedImage(filename)
+
+
+def _key(filename, box):
+    if isinstance(filename, bytes):
+        return file_hash(filename), box
+    path = os.path.abspath(filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None, box
+    return path, stat.st_mtime_ns, stat.st_size, box
+
+
+def prefetch(filename, box=None):
+    # images are decoded and resampled in threads while the rest of the document is converted
+    global _executor
+    key = _key(filename, box)
+    with _lock:
+        if key in _pending:
+            _pending.move_to_end(key)
+            return _pending[key]
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+        return _remember(_pending, key, _executor.submit(prepare, filename, box))
+
+
+def load(filename, box=None):
+    return prefetch(filename, box).result()
+
+
+def export(filename, box=None):
+    # an image prepared here for another process, which takes it with provide
+    return _key(filename, box), load(filename, box)
+
+
+def provide(key, image):
+    future = Future()
+    future.set_result(image)
+    with _lock:
+        _remember(_pending, key, future)
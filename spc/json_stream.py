@@ -0,0 +1,117 @@
+import json
+
+from spc.sources import open_text
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = ' \t\n\r'
+
+
+class _Reader:
+    # decodes one JSON value at a time from a file read in chunks
+    def __init__(self, file):
+        self.__file = file
+        self.__buffer = ''
+        self.__pos = 0
+        self.__eof = False
+        self.__decoder = json.JSONDecoder()
+
+    def __fill(self):
+        if self.__eof:
+            return False
+        data = self.__file.read(CHUNK_SIZE)
+        if not data:
+            self.__eof = True
+            return False
+        self.__buffer = self.__buffer[self.__pos:] + data
+        self.__pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in WHITESPACE:
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__fill():
+                raise ValueError('unexpected end of JSON')
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f'expected {chars!r} got {char!r}')
+        self.__pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+            except json.JSONDecodeError:
+                if not self.__fill():
+                    raise
+                continue
+            # a number cut at the end of the buffer decodes as a shorter one
+            if len(self.__buffer) - end < 64 and self.__fill():
+                continue
+            self.__pos = end
+            return value
+
+    def items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.expect(']')
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+    def keys(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self.expect('}')
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+
+class JSONArray:
+    # array value of the top level object of a JSON file, parsed one item at a time on every iteration
+    def __init__(self, filename, key, length):
+        self.__filename = filename
+        self.__key = key
+        self.__length = length
+
+    def __len__(self):
+        return self.__length
+
+    def moved(self, filename):
+        # the same array in another file with the same content
+        return JSONArray(filename, self.__key, self.__length)
+
+    def __iter__(self):
+        with open_text(self.__filename) as file:
+            reader = _Reader(file)
+            for key in reader.keys():
+                if key == self.__key:
+                    yield from reader.items()
+                    return
+                reader.value()
+
+
+def load_object(filename, streamed=()):
+    # the top level object of a JSON file or its content, the arrays of streamed keys are only counted
+    result = {}
+    with open_text(filename) as file:
+        reader = _Reader(file)
+        for key in reader.keys():
+            if key in streamed:
+                result[key] = JSONArray(filename, key, sum(1 for _item in reader.items()))
+            else:
+                result[key] = reader.value()
+    return result
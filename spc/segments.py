@@ -0,0 +1,290 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import PageBreak, NextPageTemplate
+from reportlab.platypus.tableofcontents import TableOfContents
+
+from spc import images
+from spc.events import logger
+from spc.standard.doc import SPCTitle, SPCTableOfContent, SPCImage
+
+# layouts of the title and the table of contents repeated until the page numbers stop moving
+MAX_ROUNDS = 10
+
+
+class SegmentCanvas(Canvas):
+    # remembers where the bookmarks of a segment are. A link to a bookmark of another segment points
+    # to an extra last page, at the height of the index of its name, and is sent to the bookmark after the merge
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bookmarks = {}
+        self.foreign = []
+
+    def bookmarkPage(self, key, fit='Fit', left=None, top=None, bottom=None, right=None, zoom=None):
+        self.bookmarks[key] = (self.getPageNumber() - 1, fit, left, top, zoom)
+        return super().bookmarkPage(key, fit, left, top, bottom, right, zoom)
+
+    def save(self):
+        self.foreign = sorted(name for name, destination in self._destinations.items() if destination.fmt is None)
+        for index, name in enumerate(self.foreign):
+            Canvas.bookmarkPage(self, name, 'XYZ', 0, index)
+        if self.foreign:
+            self.showPage()
+        super().save()
+
+
+class SegmentJob:
+    def __init__(self, items, template, first_page, page_count=0, entries=()):
+        self.items = items
+        self.template = template
+        self.first_page = first_page
+        # the whole document, for the title and the table of contents
+        self.page_count = page_count
+        self.entries = list(entries)
+        # images resampled by the main process, a worker does not prepare them again
+        self.images = []
+
+
+class SegmentLayout:
+    def __init__(self, job, pdf, pages, bookmarks, foreign, marks, entries, unresolved, elapsed):
+        self.first_page = job.first_page
+        self.page_count = job.page_count
+        self.toc = job.entries
+        self.pdf = pdf
+        self.pages = pages
+        # name -> (page of the segment, fit, left, top, zoom)
+        self.bookmarks = bookmarks
+        self.foreign = foreign
+        # (page of the segment, width, height) of the pages to number
+        self.marks = marks
+        # headings (level, text, page of the segment, bookmark)
+        self.entries = entries
+        self.unresolved = unresolved
+        self.elapsed = elapsed
+
+
+def lay_out(doc, symbols, context, job):
+    start = time.perf_counter()
+    doc.symbols = symbols
+    # titles set what the standard draws on every page
+    for item in context:
+        doc.check(item)
+        doc.prepare(item)
+    for key, image in job.images:
+        images.provide(key, image)
+    doc.segment = True
+    doc.first_page = job.first_page
+    doc.page_count = job.page_count
+    doc._firstPageTemplateIndex = [template.id for template in doc.pageTemplates].index(job.template)
+    flowables = []
+    for item in job.items:
+        item.bind(doc.on_replace)
+        doc.prepare(item)
+        flowables.extend(item.build(doc.font_name, doc.font_size))
+    for flowable in flowables:
+        if isinstance(flowable, TableOfContents):
+            flowable._lastEntries = list(job.entries)
+    pdf = BytesIO()
+    doc.build(flowables, filename=pdf, canvasmaker=SegmentCanvas)
+    return SegmentLayout(job, pdf.getvalue(), doc.page, doc.canv.bookmarks, doc.canv.foreign, doc.number_marks,
+                         doc.segment_entries, doc.unresolved, time.perf_counter() - start)
+
+
+def _document(spec):
+    cls, (args, (font_name, font_size)) = spec
+    doc = cls(*args)
+    doc.set_font(font_name)
+    doc.set_font_size(font_size)
+    return doc
+
+
+def layout_segment(spec, symbols, context, job):
+    # runs in a worker process on a document of its own
+    return lay_out(_document(spec), symbols, context, job)
+
+
+def split(doc, items):
+    # a segment ends where the next item starts a new page anyway. The page template it starts with
+    # is found from the template changes of those items, which are built here once more
+    segments, templates = [[]], []
+    template = doc.pageTemplates[doc._firstPageTemplateIndex].id
+    templates.append(template)
+    for item in items:
+        segments[-1].append(item)
+        if not (item.is_pagebreak or isinstance(item, (SPCTitle, SPCTableOfContent))):
+            continue
+        flowables = item.build(doc.font_name, doc.font_size)
+        for flowable in flowables:
+            if isinstance(flowable, NextPageTemplate):
+                template = flowable.action[1]
+            elif getattr(flowable, 'nextTemplate', None):
+                template = flowable.nextTemplate
+        if flowables and isinstance(flowables[-1], PageBreak):
+            segments.append([])
+            templates.append(template)
+    if not segments[-1]:
+        segments.pop()
+    return segments, templates[:len(segments)]
+
+
+def _is_dependent(segment):
+    return any(isinstance(item, (SPCTitle, SPCTableOfContent)) for item in segment)
+
+
+def _is_stale(doc, layout, job, dependent):
+    if layout is None:
+        return True
+    if dependent:
+        return (layout.first_page, layout.page_count, layout.toc) != (job.first_page, job.page_count, job.entries)
+    # the rest of a segment does not depend on where it starts, unless the pages look different there
+    return any(doc.page_style(layout.first_page + page) != doc.page_style(job.first_page + page)
+               for page in range(layout.pages))
+
+
+def _destination(pypdf, target):
+    page, fit, left, top, zoom = target
+    values = {'XYZ': (left, top, zoom), 'FitH': (top,), 'FitV': (left,)}.get(fit, ())
+    return pypdf.generic.ArrayObject(
+        [page, pypdf.generic.NameObject(f'/{fit}' if fit in ('XYZ', 'FitH', 'FitV') else '/Fit')] +
+        [pypdf.generic.NullObject() if value in (None, 'null') else pypdf.generic.FloatObject(value)
+         for value in values])
+
+
+def merge(doc, layouts, starts, entries, output):
+    import pypdf
+
+    writer = pypdf.PdfWriter()
+    offsets = []
+    for layout in layouts:
+        offsets.append(len(writer.pages))
+        writer.append(pypdf.PdfReader(BytesIO(layout.pdf)), import_outline=False)
+
+    targets = {}
+    for offset, layout in zip(offsets, layouts):
+        for name, (page, *place) in layout.bookmarks.items():
+            targets[name] = (writer.pages[offset + page].indirect_reference, *place)
+
+    # links to other segments point to the extra page, the height on it is the index of the name
+    for offset, layout in zip(offsets, layouts):
+        if not layout.foreign:
+            continue
+        placeholder = writer.pages[offset + layout.pages].indirect_reference.idnum
+        for page in writer.pages[offset:offset + layout.pages]:
+            annotations = page.get('/Annots')
+            if annotations is None:
+                continue
+            annotations = annotations.get_object()
+            for annotation in list(annotations):
+                annotation_object = annotation.get_object()
+                destination = annotation_object.get('/Dest')
+                if destination is None or destination[0].idnum != placeholder:
+                    continue
+                name = layout.foreign[int(destination[3])]
+                if name in targets:
+                    annotation_object[pypdf.generic.NameObject('/Dest')] = _destination(pypdf, targets[name])
+                else:
+                    annotations.remove(annotation)
+
+    # the outline is made here once, the segments do not know their levels above their first heading
+    parents = []
+    for level, text, page, key in entries:
+        if key not in targets:
+            continue
+        del parents[level:]
+        page, fit, left, top, zoom = targets[key]
+        fit = pypdf.generic.Fit.xyz(left, top, zoom) if fit == 'XYZ' else pypdf.generic.Fit.fit()
+        parents.append(writer.add_outline_item(text, page, parent=parents[-1] if parents else None, fit=fit))
+
+    numbered = []
+    overlay = BytesIO()
+    canvas = Canvas(overlay)
+    for offset, start, layout in zip(offsets, starts, layouts):
+        for page, width, height in layout.marks:
+            canvas.setPageSize((width, height))
+            doc.draw_page_number(canvas, start + page - 1, width, height)
+            canvas.showPage()
+            numbered.append(offset + page - 1)
+    canvas.save()
+    for page, numbers in zip(numbered, pypdf.PdfReader(overlay).pages):
+        writer.pages[page].merge_page(numbers)
+
+    for offset, layout in reversed(list(zip(offsets, layouts))):
+        if layout.foreign:
+            writer.remove_page(offset + layout.pages)
+    writer.write(output)
+
+
+def _report(doc, index, layout):
+    doc.events.emit('segment', index=index, pages=layout.pages, elapsed=layout.elapsed)
+
+
+def build(doc, items, jobs):
+    # lays the segments out in worker processes and merges them into doc.filename.
+    # False when the document is better laid out in one process
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        logger.warning('pypdf is not installed, the document is laid out in one process')
+        return False
+    segments, templates = split(doc, items)
+    dependent = [_is_dependent(segment) for segment in segments]
+    if dependent.count(False) < 2:
+        return False
+
+    context = [item for item in items if isinstance(item, SPCTitle)]
+    for item in context:
+        doc.prepare(item)
+    spec = doc.__class__, doc.segment_args()
+    layouts = [None] * len(segments)
+
+    def job(index, starts, total, entries):
+        if dependent[index]:
+            return SegmentJob(segments[index], templates[index], starts[index], total, entries)
+        return SegmentJob(segments[index], templates[index], starts[index])
+
+    with doc.events.phase('segments', count=len(segments)), \
+            ProcessPoolExecutor(max_workers=min(jobs, dependent.count(False)),
+                                mp_context=multiprocessing.get_context('spawn')) as pool:
+        rounds = 0
+        while True:
+            # a segment not laid out yet is taken for one page
+            pages = [layout.pages if layout else 1 for layout in layouts]
+            starts = [1 + sum(pages[:index]) for index in range(len(segments))]
+            entries = [(level, text, start + page - 1, key) for start, layout in zip(starts, layouts) if layout
+                       for level, text, page, key in layout.entries]
+            pending = {index: job(index, starts, sum(pages), entries) for index in range(len(segments))}
+            pending = {index: value for index, value in pending.items()
+                       if _is_stale(doc, layouts[index], value, dependent[index])}
+            if not pending:
+                break
+            rounds += 1
+            if rounds > MAX_ROUNDS:
+                raise IndexError(f'page numbers not resolved after {MAX_ROUNDS} layouts of the segments')
+            # the title and the table of contents wait for the pages of the rest, they are small
+            # and laid out here
+            ready = all(layout or dependent[index] for index, layout in enumerate(layouts))
+            futures = {}
+            for index, value in pending.items():
+                if not dependent[index]:
+                    value.images = [images.export(item.filename, item.box) for item in value.items
+                                    if isinstance(item, SPCImage)]
+                    futures[index] = pool.submit(layout_segment, spec, doc.symbols, context, value)
+            if ready:
+                for index, value in pending.items():
+                    if dependent[index]:
+                        layouts[index] = lay_out(_document(spec), doc.symbols, context, value)
+                        _report(doc, index, layouts[index])
+            for index, future in futures.items():
+                layouts[index] = future.result()
+                _report(doc, index, layouts[index])
+
+    with doc.events.phase('merge', pages=sum(pages)):
+        doc.page = doc.page_count = sum(pages)
+        merge(doc, layouts, starts, entries, doc.filename)
+    doc.passes = rounds
+    for value in layouts:
+        doc.unresolved |= value.unresolved
+    return True
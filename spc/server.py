@@ -0,0 +1,179 @@
+import base64
+import json
+import multiprocessing
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from spc.batch import build_project, build_memory
+from spc.spc_yaml import Font, FontFamily
+
+FONT_DIR = Path(__file__).resolve().parent.parent / 'font'
+
+
+def _warm(font):
+    # runs once in every worker: the imports, standards and the font family are ready before the first job
+    # arrives. A project using the same font files under the same names finds them registered
+    from reportlab.pdfbase.pdfmetrics import registerFontFamily
+    from spc.core import preload
+    from spc.fonts import register_font
+    preload()
+    if font is None:
+        return
+    family = {}
+    for item in font.fonts:
+        try:
+            register_font(item.name, item.filename)
+        except OSError:
+            continue
+        family[item.type] = item.name
+    if len(family) == 3:
+        registerFontFamily(font.family, **family)
+
+
+def project_fonts(filename):
+    # the font family configured in a project, with its files relative to the project
+    from spc.core import parse_project
+    with open(filename, 'rb') as file:
+        font = parse_project(file.read()).config.font
+    path = Path(filename).resolve().parent
+    return font.copy(update={'fonts': [item.copy(update={'filename': str(path / item.filename)})
+                                       for item in font.fonts]})
+
+
+def default_fonts():
+    # the family of the fonts shipped in font/, 'Name', 'Name Bold' and 'Name Italic'
+    fonts = []
+    for path in sorted(FONT_DIR.glob('*.ttf')) if FONT_DIR.is_dir() else []:
+        kind = path.stem.rsplit(' ', 1)[-1].lower()
+        fonts.append(Font(name=path.stem, filename=str(path), type=kind if kind in ('bold', 'italic') else 'normal'))
+    family = [item.name for item in fonts if item.type == 'normal']
+    if not family:
+        return None
+    return FontFamily(family=family[0], size=12, fonts=fonts)
+
+
+class JobError(Exception):
+    pass
+
+
+class RenderPool:
+    def __init__(self, workers=None, font=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = 0
+        self.__lock = threading.Lock()
+        # forking a process that already runs server and image threads may copy a held lock
+        self.__pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                          initializer=_warm, initargs=(default_fonts() if font is None else font,))
+        # the workers are started now, not by the first job
+        for future in [self.__pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def render(self, filename):
+        with self.__lock:
+            self.jobs += 1
+        return self.__pool.submit(build_project, os.path.abspath(filename)).result()
+
+    def render_files(self, project, files):
+        # project is the yaml text, files maps names relative to it to their content. Nothing is written to disk
+        for name in files:
+            if os.path.isabs(name) or os.path.normpath(name).split(os.sep)[0] == '..':
+                raise JobError(f'file name {name!r} is outside the project')
+        with self.__lock:
+            self.jobs += 1
+        return self.__pool.submit(build_memory, project, files).result()
+
+    def shutdown(self):
+        self.__pool.shutdown()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    # GET /health
+    # POST /render {"project": "path/to/project.yaml"} -> json with the output path
+    # POST /render {"yaml": "...", "files": {"name": "base64"}} -> the pdf
+    server_version = 'spc'
+
+    def address_string(self):
+        # a unix socket has no client address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def __send(self, code, body, content_type='application/json', headers=None):
+        if content_type == 'application/json':
+            body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.__send(404, {'error': 'not found'})
+            return
+        pool = self.server.pool
+        self.__send(200, {'workers': pool.workers, 'jobs': pool.jobs})
+
+    def do_POST(self):
+        if self.path != '/render':
+            self.__send(404, {'error': 'not found'})
+            return
+        start = time.perf_counter()
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(job, dict):
+                raise JobError('the job must be a JSON object')
+            if 'project' in job:
+                if not isinstance(job['project'], str):
+                    raise JobError('"project" must be the path of a project')
+                result, pdf = self.server.pool.render(job['project']), None
+            elif 'yaml' in job:
+                files = job.get('files', {})
+                if not isinstance(job['yaml'], str):
+                    raise JobError('"yaml" must be the text of a project')
+                if not isinstance(files, dict) or not all(isinstance(content, str) for content in files.values()):
+                    raise JobError('"files" must map file names to their base64 content')
+                files = {name: base64.b64decode(content) for name, content in files.items()}
+                result, pdf = self.server.pool.render_files(job['yaml'], files)
+            else:
+                raise JobError('"project" or "yaml" must be provided')
+        except (ValueError, TypeError, JobError) as e:
+            self.__send(400, {'error': str(e)})
+            return
+        if not result.ok:
+            self.__send(422, {'error': result.error, 'elapsed': result.elapsed})
+        elif pdf is not None:
+            self.__send(200, pdf, 'application/pdf', {'X-Pages': str(result.pages),
+                                                      'X-Elapsed': f'{time.perf_counter() - start:.3f}'})
+        else:
+            self.__send(200, {'output': result.output, 'pages': result.pages, 'elapsed': result.elapsed})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(host='127.0.0.1', port=8765, socket_path=None, workers=None, font=None, on_ready=None):
+    # font is the FontFamily the workers register before the first job, the one in font/ by default
+    pool = RenderPool(workers, font)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, RenderHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RenderHandler)
+    server.pool = pool
+    if on_ready:
+        on_ready(server)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        pool.shutdown()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,33 @@
+import io
+import os
+
+# a file of a project is given by its name on disk, or by its content as bytes when
+# the project is loaded from memory
+
+
+def open_text(source):
+    if isinstance(source, bytes):
+        return io.StringIO(source.decode('utf-8'))
+    return open(source, 'r', encoding='utf-8')
+
+
+class ProjectFiles:
+    # names in a project are relative to its directory. A project loaded from memory gets the files
+    # from resolver(name) -> bytes, or from a dict of them
+    def __init__(self, directory='.', resolver=None):
+        self.directory = str(directory)
+        if isinstance(resolver, dict):
+            files = {os.path.normpath(name): content for name, content in resolver.items()}
+            resolver = lambda name: files[os.path.normpath(name)]
+        self.__resolver = resolver
+
+    def __call__(self, name):
+        if self.__resolver is None:
+            return os.path.join(self.directory, name)
+        try:
+            content = self.__resolver(name)
+        except KeyError:
+            content = None
+        if content is None:
+            raise FileNotFoundError(f'{name} is not provided')
+        return content.encode('utf-8') if isinstance(content, str) else bytes(content)
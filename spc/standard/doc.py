@@ -1,6 +1,10 @@
-import re
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from functools import partial
 from hashlib import sha1
+from io import BytesIO
+from itertools import groupby, islice
 from typing import Literal, Optional, List, Union
 
 import reportlab.platypus
@@ -9,23 +13,25 @@ from pydantic import BaseModel, Field
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.pdfmetrics import registerFontFamily
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.platypus import BaseDocTemplate, Paragraph, Image, PageBreak, Table, TableStyle, IndexingFlowable
+from reportlab.lib.units import mm, toLength
+from reportlab.pdfbase.pdfmetrics import registerFontFamily, stringWidth
+from reportlab.platypus import BaseDocTemplate, Paragraph, Image, PageBreak, Table, TableStyle, Flowable
+from reportlab.platypus.paragraph import cleanBlockQuotedText
 from reportlab.platypus.tableofcontents import TableOfContents, SimpleIndex, ReferenceText
 from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER, TA_LEFT
 
+from spc import images
+from spc.events import Events, logger
+from spc.fonts import register_font
+from spc.standard.macros import macros
+
 
 class SPCItem(ABC):
+    # the item makes an entry of the table of contents
+    heading = False
+
     def __init__(self, on_replace=None):
         self.onReplace = on_replace
-        self.__symbol_spesials = {
-            '%landscape': PageBreak('landscape'),
-            '%portrait': PageBreak('portrait'),
-            '%pagebreak': PageBreak()
-        }
 
     @abstractmethod
     def build(self, font_name, font_size):
@@ -35,39 +41,57 @@ class SPCItem(ABC):
     def replace_special(self):
         pass
 
+    def bind(self, on_replace):
+        self.onReplace = on_replace
+
+    def __getstate__(self):
+        # on_replace is a method of the document, a cached item is bound again to the next one
+        state = self.__dict__.copy()
+        if 'onReplace' in state:
+            state['onReplace'] = None
+        return state
+
+    @property
+    def is_pagebreak(self):
+        return False
+
+    def labels(self):
+        # (label, text a reference to it is replaced by)
+        return []
+
     def find_special(self, text):
-        result = []
-        for key, item in self.__symbol_spesials.items():
-            span = re.search(key, text)
-            if span:
-                result.append(item)
-        return result
+        return macros.blocks(text)
 
     def find_and_replace(self, text):
-        result = re.search(r"%ref\(\w+\)", text)
-        if result:
-            label = text[result.start(): result.end()]
-            s = label.replace('%ref(', '')
-            s = s.replace(')', '')
-            if self.onReplace:
-                index = self.onReplace(s)
-                text = text.replace(label, f'<a href="#{s}">{index}</a>')
-        return text
+        return macros.expand(text, self.onReplace)
 
 
 class SPCImage(SPCItem):
+    # numbered standards put the number of the image in its caption
+    caption_format = '{caption}'
+
     def __init__(self, caption, filename, reference, image_index):
         super().__init__()
-        self.caption = caption
-        self.__filename = filename
+        self.__caption = caption
+        self.filename = filename
         self.reference = reference
         self.caption_alignment = TA_LEFT
         self.image_index = image_index
+        # width and height of the largest frame, set by the document
+        self.box = None
+
+    @property
+    def caption(self):
+        return self.caption_format.format(index=self.image_index, caption=self.__caption)
 
     def build(self, font_name, font_size):
         style = ParagraphStyle(name='image_caption', fontName=font_name, fontSize=font_size, alignment=self.caption_alignment)
+        image = images.load(self.filename, self.box)
         return [Paragraph(f'<a name="{self.reference}"/>', style=style),
-                Image(filename=self.__filename), Paragraph(self.caption, style=style)]
+                FittedImage(image.source, image.width, image.height), Paragraph(self.caption, style=style)]
+
+    def labels(self):
+        return [(self.reference, self.image_index)] if self.reference else []
 
     def replace_special(self):
         pass
@@ -87,6 +111,11 @@ class SPCList(SPCItem):
         for item in self.__items:
             item.replace_special()
 
+    def bind(self, on_replace):
+        super().bind(on_replace)
+        for item in self.__items:
+            item.bind(on_replace)
+
     @property
     def sub_list_index(self):
         return self.__sub_list_index
@@ -98,6 +127,27 @@ class SPCList(SPCItem):
     def append(self, item):
         self.__items.append(item)
 
+    def number(self, index):
+        if self.__is_letter:
+            return self.get_letter(self.__start + index)
+        return self.__start + index
+
+    def labels(self):
+        result = []
+        index = 0
+        for item in self.__items:
+            if isinstance(item, SPCParagraph):
+                found = macros.find(item.text, 'label')
+                if found and found[1] and self.__start:
+                    result.append((found[1], self.number(index)))
+                elif found and found[1]:
+                    logger.warning('label %s is in an item of an unordered list, it has no number to refer to',
+                                   found[1])
+                index += 1
+            elif isinstance(item, SPCList):
+                result += item.labels()
+        return result
+
     def build(self, font_name, font_size):
         result = []
         style = ParagraphStyle(name='_Heading1',
@@ -116,11 +166,9 @@ class SPCList(SPCItem):
             if isinstance(item, SPCParagraph):
                 if not self.__start:
                     bullet = '-'
-                elif self.__is_letter:
-                    bullet = f'{self.get_letter(self.__start + index)}{self.__after}'
                 else:
-                    bullet = f'{self.__start+index}{self.__after}'
-                result.append(Paragraph(f'<bullet>{bullet}</bullet>{item.text}', style=style))
+                    bullet = f'{self.number(index)}{self.__after}'
+                result.append(reference_paragraph(f'<bullet>{bullet}</bullet>{item.text}', style, item.onReplace))
                 index += 1
             elif isinstance(item, SPCList):
                 # result.append(Paragraph('<bullet>1</bullet>test'))
@@ -128,12 +176,100 @@ class SPCList(SPCItem):
         return result
 
 
+TABLE_COLORS = {'yellow': colors.yellow, 'green': colors.green, 'darkgreen': colors.darkgreen}
+# modes of the columns of a table, a format may give the width of the column after them
+COLUMN_MODES = ('', 'str', 'color', 'span')
+
+
+def column_width(value):
+    # a length ('30mm', '2cm', '85'), a share of the width left by the lengths ('25%', '2*'),
+    # 'auto' measured over all rows (None) or 'autoN' measured over the first N rows
+    value = value.strip()
+    if value in ('', 'auto'):
+        return None
+    if value.startswith('auto'):
+        return 'auto', int(value[4:])
+    if value.endswith('*'):
+        return '*', float(value[:-1] or 1)
+    if value.endswith('%'):
+        return f'{float(value[:-1])}%'
+    return toLength(value)
+
+
+def column_format(value):
+    # 'mode', 'mode:width' or just 'width'. Formats not known here ('int', 'date') were always
+    # ignored, such a column keeps its mode and is measured
+    if not isinstance(value, str):
+        # a number or a list from the json of a table
+        logger.warning('unknown column format %r, the column width is measured', value)
+        return '', None
+    mode, _, width = value.partition(':')
+    if not width and mode not in COLUMN_MODES:
+        mode, width = '', mode
+    try:
+        return mode, column_width(width)
+    except ValueError:
+        logger.warning('unknown column format %r, the column width is measured', value)
+        return mode, None
+
+
+def _column_width(rows, col, font_name, font_size):
+    # the widest line of the column with the default left and right padding of a cell
+    return max((stringWidth(line, font_name, font_size) for row in rows if col < len(row)
+                for line in str(row[col]).split('\n')), default=0.0) + 12
+
+
+class TextWidths(dict):
+    # widths of cell texts by (font name, font size, text), kept by the document for all passes.
+    # Tables repeat a few values over and over and measure them again on every pass
+    def __init__(self):
+        super().__init__()
+        self.__paragraphs = {}
+
+    def __missing__(self, key):
+        font_name, font_size, text = key
+        width = self[key] = stringWidth(text, font_name, font_size)
+        return width
+
+    def paragraph(self, paragraph):
+        # the widest word, the markup is in the text
+        key = (paragraph.style.fontName, paragraph.style.fontSize, paragraph.text)
+        if key not in self.__paragraphs:
+            self.__paragraphs[key] = paragraph.minWidth()
+        return self.__paragraphs[key]
+
+
+class MeasuredTable(Table):
+    # measures its plain text and paragraph cells with the widths of the document it is built in
+    def __widths(self):
+        return getattr(getattr(getattr(self, 'canv', None), '_doctemplate', None), 'text_widths', None)
+
+    def _elementWidth(self, v, s):
+        widths = self.__widths()
+        if widths is not None:
+            if isinstance(v, str):
+                return max(widths[s.fontname, s.fontsize, line] for line in v.split('\n'))
+            if type(v) is Paragraph:
+                return widths.paragraph(v)
+        return super()._elementWidth(v, s)
+
+
 class SPCTable(SPCItem):
+    # tables with more data rows are laid out in page sized chunks
+    chunk_threshold = 500
+    # rows measured for the column widths of a chunked table
+    sample_rows = 50
+
     def __init__(self, header, table_index, format_columns):
         super().__init__()
         self.__header = header
-        self.__columns = format_columns
+        formats = [column_format(value) for value in format_columns]
+        self.__columns = [mode for mode, _width in formats]
+        self.__widths = []
+        self.__set_widths([width for _mode, width in formats])
         self.__data = [header] if header else []
+        # data rows of a chunked table, read again on every build pass
+        self.__rows = None
         self.__caption = ''
         self.__label = '__'
         self.__index = table_index
@@ -146,6 +282,23 @@ class SPCTable(SPCItem):
     def append(self, row):
         self.__data.append(row)
 
+    def extend(self, rows):
+        # rows is a sized re-iterable source, the rows of a chunked table are never kept in memory
+        if len(rows) > self.chunk_threshold:
+            self.__rows = rows
+        else:
+            for row in rows:
+                self.append(row)
+
+    def set_source(self, filename):
+        # the chunked rows are read from filename, a file with the content of the one they came from
+        if self.__rows is not None:
+            self.__rows = self.__rows.moved(filename)
+
+    @property
+    def is_chunked(self):
+        return self.__rows is not None or len(self.__data) - 1 > self.chunk_threshold
+
     @property
     def caption(self):
         return self.__caption
@@ -162,22 +315,109 @@ class SPCTable(SPCItem):
     def table_index(self, value):
         self.__index = value
 
+    def labels(self):
+        return [(self.__label, self.__index)] if self.__label != '__' else []
+
     def replace_special(self):
         pass
 
+    def set_widths(self, values):
+        self.__set_widths([column_width(value) for value in values])
+
+    def __set_widths(self, widths):
+        stars = sum(width[1] for width in widths if isinstance(width, tuple) and width[0] == '*')
+        if stars:
+            # the proportional columns share what the percentages leave
+            rest = max(0.0, 100 - sum(float(width[:-1]) for width in widths if isinstance(width, str)))
+            widths = [f'{rest * width[1] / stars}%' if isinstance(width, tuple) and width[0] == '*' else width
+                      for width in widths]
+        self.__widths = widths
+
     def set_caption(self, value):
-        x = re.search(r"%label\(\w+\)", value)
-        if x:
-            label = value[x.start(): x.end()]
-            value = value[:x.start()]
-            # label = label.replace('%label(', '<a name=\"')
-            # label = label.replace(')', '\"/>')
-            label = label.replace('%label(', '')
-            label = label.replace(')', '')
-            self.__label = label
+        value, widths = macros.take(value, 'widths')
+        if widths:
+            self.set_widths(widths.split(','))
+        found = macros.find(value, 'label')
+        if found and found[1]:
+            value, self.__label = found
         self.__caption = value
 
+    def continuation(self, font_name, font_size):
+        # flowable put above the table on every following page of a chunked table
+        return None
+
+    def _window(self, rows, first):
+        # style commands of the data rows, numbered as in the whole table starting with first.
+        # Runs of equal adjacent cells get one command, the values of color columns are
+        # replaced by the background
+        commands = []
+        for col, cvalue in enumerate(self.__columns):
+            if cvalue not in ('color', 'span'):
+                continue
+            start = first
+            for value, run in groupby(row[col] for row in rows):
+                end = start + sum(1 for _cell in run) - 1
+                if cvalue == 'span':
+                    # a single cell spans nothing
+                    if end > start:
+                        commands.append(('SPAN', (col, start), (col, end)))
+                elif value in TABLE_COLORS:
+                    commands.append(('BACKGROUND', (col, start), (col, end), TABLE_COLORS[value]))
+                start = end + 1
+            if cvalue == 'color':
+                for row in rows:
+                    row[col] = ''
+        return commands
+
+    def _column_widths(self, rows, header, font_name, font_size, sampled=False):
+        # widths of the columns from their formats, None for a column the table measures over all its rows.
+        # A column is measured here over the rows given when the table is sampled or has proportional columns,
+        # they share the width the others leave
+        widths = (self.__widths + [None] * len(self.__columns))[:len(self.__columns)]
+        proportional = any(isinstance(width, str) for width in widths)
+        result = []
+        for col, width in enumerate(widths):
+            if isinstance(width, tuple):
+                width = _column_width(rows[:header + width[1]], col, font_name, font_size)
+            elif width is None and (sampled or proportional):
+                width = _column_width(rows, col, font_name, font_size)
+            result.append(width)
+        return None if all(width is None for width in result) else result
+
+    def _build_chunked(self, font_name, font_size):
+        if self.__rows is not None:
+            header = self.__data
+            rows = self.__rows
+        else:
+            header = self.__data[:1]
+            rows = self.__data[1:]
+
+        def window(chunk, first):
+            chunk = [row[:] for row in chunk]
+            commands = self._window(chunk, first)
+            last = first + len(chunk) - 1
+            for (r0, c0), (r1, c1) in self.spans:
+                if r1 >= first and r0 <= last:
+                    commands.append(('SPAN', (c0, max(r0, first)), (c1, min(r1, last))))
+            return chunk, commands
+
+        style = [
+            ('FONT', (0, 0), (-1, -1), font_name, font_size),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ]
+        style += [('SPAN', (c0, r0), (c1, min(r1, len(header) - 1)))
+                  for (r0, c0), (r1, c1) in self.spans if r0 < len(header)]
+        count = max([self.sample_rows] + [width[1] for width in self.__widths if isinstance(width, tuple)])
+        sample = header + window(list(islice(rows, count)), len(header))[0]
+        widths = self._column_widths(sample, len(header), font_name, font_size, True)
+        return ChunkedTable(header, rows, widths, style, window, 1.2 * font_size + 6,
+                            self.continuation(font_name, font_size))
+
     def build(self, font_name, font_size):
+        if self.is_chunked:
+            return [self._build_chunked(font_name, font_size)]
+
         table_style = TableStyle([
             ('FONT', (0, 0), (-1, -1), font_name, font_size),
             ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
@@ -191,35 +431,89 @@ class SPCTable(SPCItem):
             end = (span[1][1], span[1][0])
             table_style.add('SPAN', start, end)
 
-        for col, cvalue in enumerate(self.__columns):
-            if cvalue == 'color':
-                _len = len(self.__data)
-                for row in range(1, _len):
-                    rvalue = self.__data[row]
-                    if rvalue[col] == 'yellow':
-                        table_style.add('BACKGROUND', (col, row), (col, row), colors.yellow)
-                    elif rvalue[col] == 'green':
-                        table_style.add('BACKGROUND', (col, row), (col, row), colors.green)
-                    elif rvalue[col] == 'darkgreen':
-                        table_style.add('BACKGROUND', (col, row), (col, row), colors.darkgreen)
-                    rvalue[col] = ''
-                    self.__data[row] = rvalue
-            elif cvalue == 'span':
-                start = 1
-                _len = len(self.__data) - 1
-                for row in range(1, _len):
-                    rcurrent = self.__data[row][col]
-                    rnext = self.__data[row+1][col]
-                    if rcurrent != rnext:
-                        table_style.add('SPAN', (col, start), (col, row))
-                        start = row + 1
-                table_style.add('SPAN', (col, start), (col, _len))
-
-        table = Table(data=self.__data, repeatRows=1)
+        # the table is built again on every pass, the color cells are cleared in a copy of the rows
+        data = self.__data[:1] + [row[:] for row in self.__data[1:]]
+        for command in self._window(data[1:], 1):
+            table_style.add(*command)
+
+        table = MeasuredTable(data=data, colWidths=self._column_widths(data, 1, font_name, font_size),
+                              repeatRows=1)
         table.setStyle(table_style)
         return [table]
 
 
+class ChunkedTable(Flowable):
+    # a table with a huge number of rows, laid out one page sized chunk at a time so every
+    # page only measures and splits its own rows. The header is repeated on every page
+    def __init__(self, header, rows, col_widths, style, window, min_row_height, continuation=None):
+        super().__init__()
+        self.__header = header
+        self.__source = rows
+        self.__col_widths = col_widths
+        self.__style = style
+        self.__window = window
+        self.__min_row_height = min_row_height
+        self.__continuation = continuation
+        self.__position = 0
+        # rows read ahead, the parts split off continue the iterator of the first one
+        self.__iterator = None
+        self.__buffer = []
+
+    def __fetch(self, count):
+        if self.__source is not None:
+            # the first part starts over on every build pass
+            self.__iterator = iter(self.__source)
+            self.__buffer = []
+        if len(self.__buffer) < count:
+            self.__buffer += islice(self.__iterator, count - len(self.__buffer))
+        return self.__buffer[:count]
+
+    def __chunk(self, availHeight):
+        # more rows than the frame can hold, so only the rows of this page are measured
+        count = int(availHeight // self.__min_row_height) + 2
+        first = len(self.__header) + self.__position
+        # one more row tells whether any is left
+        rows, commands = self.__window(self.__fetch(count + 1)[:count], first)
+        shift = first - len(self.__header)
+        style = TableStyle(self.__style)
+        for name, (c0, r0), (c1, r1), *args in commands:
+            style.add(name, (c0, r0 - shift), (c1, r1 - shift), *args)
+        table = MeasuredTable(self.__header + rows, colWidths=self.__col_widths, repeatRows=len(self.__header))
+        table.setStyle(style)
+        return table
+
+    def __remainder(self, consumed):
+        part = ChunkedTable(self.__header, None, self.__col_widths, self.__style, self.__window,
+                            self.__min_row_height, self.__continuation)
+        part.__iterator = self.__iterator
+        part.__buffer = self.__buffer[consumed:]
+        part.__position = self.__position + consumed
+        return part
+
+    def wrap(self, availWidth, availHeight):
+        # never drawn itself, the frame always splits it into plain tables. Proportional columns fill the frame
+        if any(isinstance(width, str) for width in self.__col_widths):
+            return availWidth, availHeight + 1
+        return sum(self.__col_widths), availHeight + 1
+
+    def split(self, availWidth, availHeight):
+        result = []
+        if self.__continuation is not None and self.__position:
+            result.append(self.__continuation)
+            availHeight -= self.__continuation.wrap(availWidth, availHeight)[1] + \
+                self.__continuation.getSpaceBefore() + self.__continuation.getSpaceAfter()
+        parts = self.__chunk(availHeight).split(availWidth, availHeight)
+        if not parts:
+            return []
+        consumed = len(parts[0]._cellvalues) - len(self.__header)
+        if consumed <= 0:
+            return []
+        result.append(parts[0])
+        if consumed < len(self.__buffer):
+            result.append(self.__remainder(consumed))
+        return result
+
+
 class SPCTitle(SPCItem):
     def __init__(self, company, caption, doc_type):
         self.__company = company
@@ -263,6 +557,10 @@ class SPCParagraph(SPCItem):
     def text(self):
         return self.__text
 
+    @property
+    def is_pagebreak(self):
+        return len(self.find_special(self.__text)) > 0
+
     def build(self, font_name, font_size):
         result = self.find_special(self.__text)
         if len(result):
@@ -270,13 +568,18 @@ class SPCParagraph(SPCItem):
         style = ParagraphStyle(name="text", fontName=font_name, fontSize=font_size,
                                firstLineIndent=self.__indent,
                                spaceBefore=6 * mm)
-        return [reportlab.platypus.Paragraph(self.__text, style=style)]
+        return [reference_paragraph(self.__text, style, self.onReplace)]
 
 
 class SPCChapter(SPCItem):
+    heading = True
+
     def __init__(self, level, text, alignment=TA_CENTER):
         self.__level = level
-        self.__text = text
+        self.__label = None
+        self.text = text
+        # what a reference to the chapter is replaced by, numbered standards set the chapter number
+        self.number = None
         self.__align = alignment
         self.__indent = 0
         self.space_before = 10 * mm
@@ -296,8 +599,18 @@ class SPCChapter(SPCItem):
 
     @text.setter
     def text(self, value):
+        value, label = macros.take(value, 'label')
+        self.__label = label or self.__label
         self.__text = value
 
+    def labels(self):
+        if self.__label is None:
+            return []
+        return [(self.__label, self.number if self.number is not None else self.__text)]
+
+    def replace_special(self):
+        pass
+
     def build(self, font_name, font_size):
         style = ParagraphStyle(name=f'Heading{self.__level}', fontName=font_name, fontSize=font_size,
                                spaceBefore=self.space_before,
@@ -306,17 +619,29 @@ class SPCChapter(SPCItem):
                                leftIndent=self.__indent
                                )
         bn = sha1(self.__text.encode()).hexdigest()
-        item = Paragraph(f'<b>{self.__text}</b><a name="{bn}"/>', style=style)
+        anchor = f'<a name="{self.__label}"/>' if self.__label else ''
+        item = Paragraph(f'<b>{self.__text}</b><a name="{bn}"/>{anchor}', style=style)
         item._bookmarkName = bn
         return [item]
 
 
 class SPCAppendix(SPCItem):
-    def __init__(self, name, caption, type):
+    heading = True
+
+    def __init__(self, name, caption, type, designation=None):
         super().__init__()
         self.__name = name
+        caption, self.__label = macros.take(caption, 'label')
         self.__caption = caption
         self.__type = type
+        self.__designation = designation if designation is not None else name
+
+    @property
+    def text(self):
+        return f'{self.__name} {self.__caption}'
+
+    def labels(self):
+        return [(self.__label, self.__designation)] if self.__label else []
 
     def replace_special(self):
         pass
@@ -324,7 +649,8 @@ class SPCAppendix(SPCItem):
     def build(self, font_name, font_size):
         bn = sha1(self.__name.encode()).hexdigest()
         style = ParagraphStyle(name="appendix", fontName=font_name, fontSize=font_size, alignment=TA_CENTER)
-        text = f'<b>{self.__name}</b><br/>({self.__type})<br/>{self.__caption}<a name="{bn}"/>'
+        anchor = f'<a name="{self.__label}"/>' if self.__label else ''
+        text = f'<b>{self.__name}</b><br/>({self.__type})<br/>{self.__caption}<a name="{bn}"/>{anchor}'
         item = Paragraph(text, style=style)
         item._bookmarkName = bn
         return [item]
@@ -334,6 +660,10 @@ class SPCPagebreak(SPCItem):
     def __init__(self):
         super().__init__()
 
+    @property
+    def is_pagebreak(self):
+        return True
+
     def replace_special(self):
         pass
 
@@ -351,7 +681,7 @@ class SPCTableOfContent(SPCItem):
     def build(self, font_name, font_size):
         style = ParagraphStyle(name='toc', fontName=font_name, fontSize=font_size, alignment=TA_CENTER)
         p = Paragraph(self.__title, style=style)
-        toc = TableOfContents()
+        toc = ReservedTableOfContents()
         toc.levelStyles = [
             ParagraphStyle(fontName=font_name, fontSize=font_size, name='Heading1')
         ]
@@ -363,7 +693,163 @@ class SPCPageTemplate:
         self.__page_template = reportlab.platypus.PageTemplate(id, pagesize=pagesize)
 
 
-class TotalPage(IndexingFlowable):
+class ReservedTableOfContents(TableOfContents):
+    # once reserved, the entries are laid out as usual but drawn as forms filled after the pass with
+    # the pages found in it. The page numbers do not change the size of the entries, so only changed
+    # headings take another pass
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reserved = False
+        # (form, page, x, y, rows, width) of the parts drawn in the pass
+        self.__parts = []
+
+    def reserve(self, entries):
+        # entries of the headings the document is going to have, their pages may be unknown yet
+        self.reserved = True
+        self._entries = list(entries)
+
+    def beforeBuild(self):
+        super().beforeBuild()
+        self.__parts = []
+
+    def isSatisfied(self):
+        if not self.reserved:
+            return super().isSatisfied()
+        return [(level, text, key) for level, text, _page, key in self._entries] == \
+            [(level, text, key) for level, text, _page, key in self._lastEntries]
+
+    def split(self, availWidth, availHeight):
+        parts = super().split(availWidth, availHeight)
+        return [ReservedPart(self, part) for part in parts] if self.reserved else parts
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        if self.reserved:
+            self.place(canvas, self._table, x, y, _sW)
+        else:
+            super().drawOn(canvas, x, y, _sW)
+
+    def place(self, canvas, table, x, y, _sW=0):
+        name = f'toc{len(self.__parts)}'
+        self.__parts.append((name, canvas.getPageNumber(), table._hAlignAdjust(x, _sW), y,
+                             len(table._cellvalues), table._colWidths[0]))
+        canvas.doForm(name)
+
+    def fill(self, canvas):
+        # draws the entries of the pass into the forms of the parts, their links go to the pages of the parts
+        if not self.__parts:
+            return
+        self._lastEntries = self._entries
+        self.canv = canvas
+        try:
+            self.wrap(self.__parts[0][5], canvas._pagesize[1])
+        finally:
+            del self.canv
+        rows = self._table._cellvalues
+        first = 0
+        for name, page, x, y, count, width in self.__parts:
+            table = Table(rows[first:first + count], colWidths=(width,), style=self.tableStyle)
+            table.wrapOn(canvas, width, canvas._pagesize[1])
+            canvas.beginForm(name)
+            table.drawOn(canvas, x, y)
+            links, canvas._annotationrefs = canvas._annotationrefs, []
+            canvas.endForm()
+            pdf_page = canvas._doc.Pages.pages[page - 1]
+            pdf_page.Annots = list(pdf_page.Annots or []) + links
+            first += count
+
+
+class ReservedPart(Flowable):
+    # a part of a reserved table of contents split over the pages
+    def __init__(self, toc, table):
+        super().__init__()
+        self.__toc = toc
+        self.__table = table
+
+    def wrap(self, availWidth, availHeight):
+        return self.__table.wrapOn(self.canv, availWidth, availHeight)
+
+    def split(self, availWidth, availHeight):
+        return [ReservedPart(self.__toc, part) for part in self.__table.splitOn(self.canv, availWidth, availHeight)]
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        self.__toc.place(canvas, self.__table, x, y, _sW)
+
+
+class FlowableStream:
+    # the story of one build pass. The flowables are made when the layout reaches them and dropped once
+    # they are laid out, reportlab takes them from the front and puts the split parts back there
+    def __init__(self, flowables):
+        self.__source = iter(flowables)
+        self.__buffer = deque()
+
+    def __fill(self, count):
+        if len(self.__buffer) < count:
+            self.__buffer.extend(islice(self.__source, count - len(self.__buffer)))
+        return len(self.__buffer) >= count
+
+    def __len__(self):
+        # a run of keepWithNext flowables is kept together with the one after it, reportlab
+        # looks for the end of the run within the length
+        self.__fill(1)
+        while self.__buffer and self.__buffer[-1].getKeepWithNext() and self.__fill(len(self.__buffer) + 1):
+            pass
+        return len(self.__buffer)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(islice(self.__buffer, index.start, index.stop))
+        self.__fill(index + 1)
+        return self.__buffer[index]
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for _ in range(index.stop):
+                self.__buffer.popleft()
+        else:
+            del self.__buffer[index]
+
+    def __setitem__(self, index, flowables):
+        # flowables[0:0] = parts
+        self.__buffer.extendleft(reversed(flowables))
+
+    def insert(self, index, flowable):
+        self.__buffer.insert(index, flowable)
+
+
+class FittedImage(Image):
+    # an image wider than the frame is shrunk to its width, one too high for an empty frame
+    # to its height instead of failing the layout
+    def wrap(self, availWidth, availHeight):
+        self._unRestrictSize()
+        frame = getattr(self, '_frame', None)
+        return self._restrictSize(availWidth, availHeight if frame is not None and frame._atTop else self.drawHeight)
+
+
+class ReferenceParagraph(Paragraph):
+    # references to labels further on are expanded when the paragraph is first laid out,
+    # every item of the document is converted and registered by then
+    def __init__(self, text, style=None, bulletText=None, frags=None, caseSensitive=1, encoding='utf8',
+                 on_replace=None):
+        super().__init__(text, style, bulletText, frags, caseSensitive, encoding)
+        self.__on_replace = on_replace
+
+    def wrap(self, availWidth, availHeight):
+        if self.__on_replace is not None:
+            text = macros.expand(self.text, partial(self.__on_replace, final=True), missing='??')
+            self.__on_replace = None
+            self._setup(text, self.style, None, None, cleanBlockQuotedText)
+        return super().wrap(availWidth, availHeight)
+
+
+def reference_paragraph(text, style, on_replace):
+    if on_replace is not None and '%ref(' in text:
+        return ReferenceParagraph(text, style, on_replace=on_replace)
+    return Paragraph(text, style=style)
+
+
+class TotalPage(Flowable):
+    # the page count of a title block. It is known when the document is closed, the flowable takes the width
+    # of its frame and the table is centred in it then
     def __init__(self, font_name, font_size):
         super().__init__()
 
@@ -374,51 +860,89 @@ class TotalPage(IndexingFlowable):
                 ('RIGHTPADDING', (0, 0), (-1, -1), 0),
                 #('LEFTPADDING', (0, 0), (-1, -1), 0),
             ])
-        self.page_count = 0
-        self.__para = 0
-        self.__isSatisfied = 0
+        self.__width = 0
 
-    def isSatisfied(self):
-        return self.__isSatisfied == 2
+    def __table(self, page_count):
+        return Table([['Листов', page_count]], style=self.defaultTableStyle)
 
-    def beforeBuild(self):
-        if self.__isSatisfied < 2:
-            self.__isSatisfied += 1
+    def wrap(self, availWidth, availHeight):
+        self.__width = availWidth
+        # one row, its height does not depend on the count
+        return availWidth, self.__table(0).wrap(availWidth, availHeight)[1]
 
-    def notify(self, kind, stuff):
-        print(kind)
+    def draw(self):
+        def draw(canvas, page_count):
+            table = self.__table(page_count)
+            width, _height = table.wrap(self.__width, self.height)
+            table.drawOn(canvas, 0, 0, self.__width - width)
 
-    def wrap(self, availWidth, availHeight):
-        self.__para = Table([['Листов', self.page_count]], style=self.defaultTableStyle)
-        return self.__para.wrap(availWidth, availHeight)
+        self.canv._doctemplate.draw_page_count(self.canv, draw)
 
-    def drawOn(self, canvas, x, y, _sW=0):
-        self.__para.drawOn(canvas, x, y, _sW)
-        # print(x)
-        # self.canv.drawCentredString(x, y, 'Test')
+
+def draw_form(canvas, name, draw):
+    # static parts of a page are put into the PDF once as a form and referenced on every page
+    forms = canvas.__dict__.setdefault('_spc_forms', set())
+    if name not in forms:
+        canvas.beginForm(name)
+        draw(canvas)
+        canvas.endForm()
+        forms.add(name)
+    canvas.doForm(name)
 
 
 class SPCDocument(ABC, BaseDocTemplate):
-    def __init__(self, filename, font: dict, font_family: dict):
+    # the table of contents is drawn after the layout into the pages reserved for its headings,
+    # otherwise the layout is repeated until its page numbers stop changing
+    reserve_toc = True
+
+    def __init__(self, filename, font: dict, font_family: dict, debug=False):
         BaseDocTemplate.__init__(self, filename)
         self.__items = []
-        self.__flowable = []
         for key, value in font.items():
-            pdfmetrics.registerFont(TTFont(key, value))
+            register_font(key, value)
         for key, value in font_family.items():
             registerFontFamily(key, normal=value['normal'], bold=value['bold'], italic=value['italic'])
+        self.__font = font
+        self.__font_family = font_family
+        self.__debug = debug
         self.__font_name = ''
         self.__font_size = 12
 
-        self.__params = {
-            'tables': {},
-            'images': {}
-        }
+        # label -> text of a reference to it
+        self.symbols = {}
+        self.unresolved = set()
+        self.page_count = 0
+        self.passes = 0
+        self.text_widths = TextWidths()
+        # (form, draw) of the page counts drawn when the document is closed, None when they are drawn at once
+        self.__deferred = None
+        self.events = Events()
+        self.__pass = 0
+        self.setProgressCallBack(self.__on_progress)
+
+        # a segment laid out on its own starts further on in the document. Its page numbers are
+        # drawn over the merged pages and its headings go to the outline from there
+        self.first_page = 1
+        self.segment = False
+        self.number_marks = []
+        self.segment_entries = []
+
+    def __on_progress(self, kind, value):
+        # called for every flowable as well, only passes and pages are reported
+        if kind == 'PASS':
+            self.__pass = value
+            self.events.emit('pass', number=value)
+        elif kind == 'PAGE':
+            self.events.emit('page', page=value, pass_number=self.__pass)
 
     @property
     def font_name(self):
         return self.__font_name
 
+    @property
+    def font_size(self):
+        return self.__font_size
+
     def set_font(self, font_name):
         self.__font_name = font_name
 
@@ -428,7 +952,8 @@ class SPCDocument(ABC, BaseDocTemplate):
     def set_table_of_content(self, title):
         self.append(SPCTableOfContent(title))
 
-    def afterFlowable(self, flowable):
+    @staticmethod
+    def toc_entry(flowable):
         if flowable.__class__.__name__ == 'Paragraph':
             text = flowable.getPlainText()
             style = flowable.style.name
@@ -449,13 +974,53 @@ class SPCDocument(ABC, BaseDocTemplate):
                     end = text.find(')')
                     text = text.replace(text[start: end+1], ' ')
             else:
-                return
-            bn = getattr(flowable, '_bookmarkName', None)
-            if bn:
-                self.notify('TOCEntry', (level, text, self.page, bn))
-                self.canv.addOutlineEntry(text, bn, level)
-            else:
-                self.notify('TOCEntry', (level, text, self.page))
+                return None
+            return level, text, getattr(flowable, '_bookmarkName', None)
+        return None
+
+    def beforeDocument(self):
+        self.number_marks = []
+        self.segment_entries = []
+
+    @property
+    def page_number(self):
+        return self.first_page + self.page - 1
+
+    def page_style(self, number):
+        # what is drawn on a page apart from its number, when it depends on the number
+        return None
+
+    def mark_page(self, canvas, width, height):
+        if self.segment:
+            self.number_marks.append((self.page, width, height))
+        else:
+            self.draw_page_number(canvas, self.page_number, width, height)
+
+    def draw_page_number(self, canvas, number, width, height):
+        pass
+
+    def draw_page_count(self, canvas, draw):
+        # draw(canvas, page_count). The count of a document being laid out is known once it is closed,
+        # until then the page refers to a form drawn with it. A segment and the merge know it already
+        if self.__deferred is None:
+            draw(canvas, self.page_count)
+            return
+        name = f'PageCount{len(self.__deferred)}'
+        self.__deferred.append((name, draw))
+        canvas.doForm(name)
+
+    def afterFlowable(self, flowable):
+        entry = self.toc_entry(flowable)
+        if entry is None:
+            return
+        level, text, bn = entry
+        if self.segment:
+            self.segment_entries.append((level, text, self.page, bn))
+        elif bn:
+            self.notify('TOCEntry', (level, text, self.page, bn))
+            self.canv.addOutlineEntry(text, bn, level)
+        else:
+            self.notify('TOCEntry', (level, text, self.page))
 
     @abstractmethod
     def check(self, item):
@@ -465,27 +1030,149 @@ class SPCDocument(ABC, BaseDocTemplate):
     def items(self):
         return self.__items
 
-    @property
-    def flowable(self):
-        return self.__flowable
+    def __register(self, item):
+        if not self.check(item):
+            return False
+        self.symbols.update(item.labels())
+        if isinstance(item, SPCImage):
+            item.box = self.image_box()
+            images.prefetch(item.filename, item.box)
+        return True
 
     def append(self, item):
-        if self.check(item):
-            if isinstance(item, SPCTable):
-                self.__params['tables'][item.label] = item.table_index
-            elif isinstance(item, SPCImage):
-                self.__params['images'][item.reference] = item.image_index
+        if self.__register(item):
             self.__items.append(item)
 
-    def on_replace(self, label):
-        variants = ['images', 'tables']
-        for var in variants:
-            if label in self.__params[var]:
-                return self.__params[var][label]
+    def prepare(self, item):
+        item.replace_special()
+
+    def on_replace(self, label, final=False):
+        # before layout an unknown label may still be defined further on
+        if label in self.symbols:
+            return self.symbols[label]
+        if final:
+            self.unresolved.add(label)
         return None
 
-    def save(self):
-        for item in self.__items:
-            self.__flowable += item.build(self.__font_name, self.__font_size)
-        #self.__flowable.append(TotalPage())
-        self.multiBuild(self.__flowable)
+    def image_box(self):
+        frames = [frame for template in self.pageTemplates for frame in template.frames]
+        if not frames:
+            return None
+        return (max(frame._width - frame._leftPadding - frame._rightPadding for frame in frames),
+                max(frame._height - frame._topPadding - frame._bottomPadding for frame in frames))
+
+    def segment_args(self):
+        # what a worker process needs to make the same document for a segment of it
+        filename = self.filename if isinstance(self.filename, str) else None
+        return (filename, self.__font, self.__font_family, self.__debug), (self.__font_name, self.__font_size)
+
+    def __headings(self, items):
+        # (level, text, bookmark) of the headings of the items, their flowables are made just for this
+        headings = []
+        for item in items:
+            if not item.heading:
+                continue
+            for flowable in item.build(self.__font_name, self.__font_size):
+                entry = self.toc_entry(flowable)
+                if entry:
+                    headings.append(entry)
+        return headings
+
+    def __iter_flowables(self, items, kept):
+        # the flowables of one pass, made from the items as the layout reaches them
+        for item in items:
+            if item in kept:
+                for flowable in kept[item]:
+                    # left by a pass where it did not fit at first
+                    flowable.__dict__.pop('_postponed', None)
+                    yield flowable
+                continue
+            start = time.perf_counter()
+            flowables = item.build(self.__font_name, self.__font_size)
+            if self.__pass == 1:
+                self.events.emit('item', item=item.__class__.__name__, flowables=len(flowables),
+                                 elapsed=time.perf_counter() - start)
+            yield from flowables
+
+    def __multi_build(self, indexing, make, max_passes=10):
+        # multiBuild on a story made anew for every pass. Its flowables are not used again,
+        # so the changes reportlab makes to them are not undone between the passes
+        self._indexingFlowables = indexing
+        self._doSave = 0
+        passes = 0
+        try:
+            while True:
+                passes += 1
+                self._onProgress('PASS', passes)
+                self.__deferred = []
+                for flowable in indexing:
+                    flowable.beforeBuild()
+                self.build(FlowableStream(make()))
+                for flowable in indexing:
+                    flowable.afterBuild()
+                if self._allSatisfied():
+                    self.__close(indexing)
+                    return passes
+                if passes > max_passes:
+                    raise IndexError(f'index entries not resolved after {max_passes} passes')
+        finally:
+            self.__deferred = None
+
+    def __close(self, indexing):
+        # what is known only when the layout is over is drawn into the forms the pages refer to
+        self.page_count = self.page
+        for flowable in indexing:
+            if isinstance(flowable, ReservedTableOfContents):
+                flowable.fill(self.canv)
+        for name, draw in self.__deferred:
+            self.canv.beginForm(name)
+            draw(self.canv, self.page_count)
+            self.canv.endForm()
+        self.canv.save()
+
+    def __report_unresolved(self):
+        if self.unresolved:
+            logger.warning('unresolved references: %s', ', '.join(sorted(self.unresolved)))
+            self.events.emit('unresolved', labels=sorted(self.unresolved))
+
+    def save(self, jobs=None):
+        # the items are kept for the build passes, their flowables live only until they are laid out
+        items = self.__items
+        if jobs and jobs > 1:
+            import spc.segments
+            if spc.segments.build(self, items, jobs):
+                self.__report_unresolved()
+                return
+            # too few segments to share out
+
+        with self.events.phase('prepare'):
+            for item in items:
+                self.prepare(item)
+            # the table of contents is the same flowable on every pass, it compares the entries with the last ones
+            kept = {item: item.build(self.__font_name, self.__font_size) for item in items
+                    if isinstance(item, SPCTableOfContent)}
+        tocs = [flowable for flowables in kept.values() for flowable in flowables
+                if isinstance(flowable, TableOfContents)]
+        if tocs and self.reserve_toc:
+            # the pages of the table of contents are taken by the headings known now
+            entries = [(level, text, 0, key) for level, text, key in self.__headings(items)]
+            for toc in tocs:
+                toc.reserve(entries)
+
+        with self.events.phase('build'):
+            self.passes = self.__multi_build(tocs, partial(self.__iter_flowables, items, kept))
+        self.__report_unresolved()
+
+    def save_to(self, file, jobs=None):
+        # file is any binary file-like object, the output of the project is not written
+        filename = self.filename
+        self.filename = file
+        try:
+            self.save(jobs)
+        finally:
+            self.filename = filename
+
+    def save_bytes(self, jobs=None):
+        output = BytesIO()
+        self.save_to(output, jobs)
+        return output.getvalue()
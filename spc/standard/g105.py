@@ -6,13 +6,13 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import PageTemplate, Frame
 from reportlab.pdfgen.canvas import Canvas
 
-from spc.standard.doc import SPCDocument
+from spc.standard.doc import SPCDocument, draw_form
 from spc.standard.g105_no_border import G105Title
 
 
 class G105Doc(SPCDocument):
     def __init__(self, filename, font, font_family, debug=False):
-        super().__init__(filename, font, font_family)
+        super().__init__(filename, font, font_family, debug)
 
         title_height_frames = [157 * mm, 50 * mm, 80 * mm]
         pageTemplates = [
@@ -33,47 +33,68 @@ class G105Doc(SPCDocument):
         self.addPageTemplates(pageTemplates=pageTemplates)
         self.__is_title = False
         self.__title_page = 2
-        self.__page_count = 0
-        self.__pass = 0
         self.__document_type = ''
         self.__document_name = ''
 
-        self.setProgressCallBack(self.onProgress)
-
-    def onProgress(self, param, value):
-        # print(f'{param} - {value}')
-        if param == 'PASS':
-            self.__pass = value
-        elif param == 'PAGE' and self.__pass == 1:
-            self.__page_count = value
-        elif param == 'SIZE_EST':
-            pass
-
     def check(self, item):
         if isinstance(item, G105Title):
             self.__document_name = item.caption
             self.__document_name = self.__document_name.replace('<br/>', '\n')
         return True
 
-    def save(self):
-        for item in self.items:
-            if isinstance(item, G105Title):
-                self.__is_title = True
-                self.__document_type = item.document_type
-            item.replace_special()
-        super().save()
+    def prepare(self, item):
+        if isinstance(item, G105Title):
+            self.__is_title = True
+            self.__document_type = item.document_type
+        item.replace_special()
 
     def onPage(self, canvas: Canvas, doc):
-        # self.__page_count += 1
-        x = 20 * mm
-        y = 5 * mm
         if self.pageTemplate.id == 'portrait' or self.pageTemplate.id == 'title':
             width = A4[0]
             height = A4[1]
         else:
             width = A4[1]
             height = A4[0]
+        orientation = 'portrait' if width == A4[0] else 'landscape'
+
+        style = self.page_style(self.page_number)
+        if style == 'title':
+            draw_form(canvas, f'G105Border{orientation}', lambda form: self.__draw_border(form, width, height))
+            return
+        if style == 'first':
+            draw_form(canvas, f'G105First{orientation}', lambda form: self.__draw_first(form, width, height))
+        else:
+            draw_form(canvas, f'G105Sheet{orientation}', lambda form: self.__draw_sheet(form, width, height))
+
+        self.mark_page(canvas, width, height)
+        canvas.setFont(tt2ps(self.font_name, 0, 1), 14)
+        if style == 'first':
+            canvas.drawCentredString(width - 70 * mm, 35 * mm, self.__document_type)
+        else:
+            canvas.drawCentredString(width - 70 * mm, 10 * mm, self.__document_type)
+        canvas.setFontSize(10)
+
+    def page_style(self, number):
+        if self.__is_title and number == 1:
+            return 'title'
+        return 'first' if self.__is_title and number == 2 or number == 1 else 'sheet'
+
+    def draw_page_number(self, canvas: Canvas, number, width, height):
+        font_name = tt2ps(self.font_name, 0, 1)
+        canvas.setFont(font_name, 10)
+        if self.page_style(number) == 'first':
+            canvas.drawCentredString(A4[0] - 35 * mm, 21 * mm, str(number))
 
+            def draw_count(form, page_count):
+                form.setFont(font_name, 10)
+                form.drawCentredString(A4[0] - 15 * mm, 21 * mm, str(page_count))
+            self.draw_page_count(canvas, draw_count)
+        else:
+            canvas.drawCentredString(width - 10 * mm, 8 * mm, str(number))
+
+    def __draw_border(self, canvas: Canvas, width, height):
+        x = 20 * mm
+        y = 5 * mm
         font_name = tt2ps(self.font_name, 0, 1)
         canvas.setFont(font_name, 10)
         canvas.line(x, y, x, height - y)
@@ -101,83 +122,75 @@ class G105Doc(SPCDocument):
         canvas.drawString(330, -35, 'Подп. и дата')
         canvas.rotate(-90)
 
-        if self.__is_title and doc.page == 1:
-            return
-        if self.__is_title and doc.page == 2 or doc.page == 1:
-            canvas.line(A4[0] - 190 * mm, 45 * mm, A4[0] - 5 * mm, 45 * mm)
-            canvas.line(A4[0] - 190 * mm, 30 * mm, A4[0] - 5 * mm, 30 * mm)
-
-            canvas.line(A4[0] - 125 * mm, 40 * mm, A4[0] - 190 * mm, 40 * mm)
-            canvas.line(A4[0] - 125 * mm, 35 * mm, A4[0] - 190 * mm, 35 * mm)
-            canvas.line(A4[0] - 125 * mm, 30 * mm, A4[0] - 190 * mm, 30 * mm)
-            canvas.line(A4[0] - 125 * mm, 25 * mm, A4[0] - 190 * mm, 25 * mm)
-            canvas.line(A4[0] - 125 * mm, 20 * mm, A4[0] - 190 * mm, 20 * mm)
-            canvas.line(A4[0] - 125 * mm, 15 * mm, A4[0] - 190 * mm, 15 * mm)
-            canvas.line(A4[0] - 125 * mm, 10 * mm, A4[0] - 190 * mm, 10 * mm)
-
-            canvas.line(A4[0] - 125 * mm, 5 * mm, A4[0] - 125 * mm, 45 * mm)
-            canvas.line(A4[0] - 135 * mm, 5 * mm, A4[0] - 135 * mm, 45 * mm)
-            canvas.line(A4[0] - 150 * mm, 5 * mm, A4[0] - 150 * mm, 45 * mm)
-            canvas.line(A4[0] - 173 * mm, 5 * mm, A4[0] - 173 * mm, 45 * mm)
-
-            canvas.line(A4[0] - 183 * mm, 30 * mm, A4[0] - 183 * mm, 45 * mm)
-
-            canvas.drawString(A4[0] - 134 * mm, 31 * mm, 'Дата')
-            canvas.drawString(A4[0] - 149 * mm, 31 * mm, 'Подп.')
-            canvas.drawString(A4[0] - 172 * mm, 31 * mm, '№ докум.')
-            canvas.drawString(A4[0] - 182 * mm, 31 * mm, 'Лист')
-            canvas.drawString(A4[0] - 190 * mm, 31 * mm, 'Изм.')
-
-            canvas.drawString(A4[0] - 189 * mm, 26 * mm, 'Разраб.')
-            canvas.drawString(A4[0] - 189 * mm, 21 * mm, 'Пров.')
-            canvas.drawString(A4[0] - 189 * mm, 11 * mm, 'Н. контр.')
-            canvas.drawString(A4[0] - 189 * mm, 6 * mm, 'Утв.')
-
-            canvas.line(A4[0] - 55 * mm, 20 * mm, A4[0] - 5 * mm, 20 * mm)
-            canvas.line(A4[0] - 55 * mm, 25 * mm, A4[0] - 5 * mm, 25 * mm)
-
-            canvas.line(A4[0] - 55 * mm, 5 * mm, A4[0] - 55 * mm, 30 * mm)
-            canvas.line(A4[0] - 40 * mm, 20 * mm, A4[0] - 40 * mm, 30 * mm)
-            canvas.line(A4[0] - 25 * mm, 20 * mm, A4[0] - 25 * mm, 30 * mm)
-
-            canvas.drawString(A4[0] - 54 * mm, 26 * mm, 'Лит.')
-            canvas.drawString(A4[0] - 39 * mm, 26 * mm, 'Лист')
-            canvas.drawCentredString(A4[0] - 15 * mm, 26 * mm, 'Листов')
-            canvas.drawCentredString(A4[0] - 35 * mm, 21 * mm, str(canvas.getPageNumber()))
-            canvas.drawCentredString(A4[0] - 15 * mm, 21 * mm, str(self.__page_count))
-
-            canvas.setFontSize(14)
-            canvas.drawCentredString(width - 70 * mm, 35 * mm, self.__document_type)
-            canvas.setFontSize(10)
-        else:
-            canvas.line(width - 190 * mm, 20 * mm, width - 5 * mm, 20 * mm)
-            canvas.line(width - 15 * mm, 13 * mm, width - 5 * mm, 13 * mm)
-
-            canvas.line(width - 190 * mm, 5 * mm, width - 190 * mm, 20 * mm)
-
-            canvas.line(width - 15 * mm, 5 * mm, width - 15 * mm, 20 * mm)
-            canvas.drawString(width - 14 * mm, 15 * mm, 'Лист')
-            canvas.drawCentredString(width - 10 * mm, 8 * mm, str(canvas.getPageNumber()))
-
-            canvas.line(width - 125 * mm, 5 * mm, width - 125 * mm, 20 * mm)
-            canvas.line(width - 135 * mm, 5 * mm, width - 135 * mm, 20 * mm)
-            canvas.line(width - 150 * mm, 5 * mm, width - 150 * mm, 20 * mm)
-            canvas.line(width - 173 * mm, 5 * mm, width - 173 * mm, 20 * mm)
-            canvas.line(width - 183 * mm, 5 * mm, width - 183 * mm, 20 * mm)
-
-            canvas.line(width - 190 * mm, 10 * mm, width - 125 * mm, 10 * mm)
-            canvas.line(width - 190 * mm, 15 * mm, width - 125 * mm, 15 * mm)
-
-            canvas.drawString(width - 134 * mm, 6 * mm, 'Дата')
-            canvas.drawString(width - 149 * mm, 6 * mm, 'Подп.')
-            canvas.drawString(width - 172 * mm, 6 * mm, '№ докум.')
-            canvas.drawString(width - 182 * mm, 6 * mm, 'Лист')
-            canvas.drawString(width - 190 * mm, 6 * mm, 'Изм.')
-
-            canvas.setFontSize(14)
-            canvas.drawCentredString(width - 70 * mm, 10 * mm, self.__document_type)
-            canvas.setFontSize(10)
-
-            # canvas.drawString(A4[0] - 125 * mm, 6 * mm, self.__document_type)
+    def __draw_footer(self, canvas: Canvas, width):
         canvas.drawString(width - 35 * mm, 1 * mm, 'Формат A4')
         canvas.drawString(width - 95 * mm, 1 * mm, 'Копировал')
+
+    def __draw_first(self, canvas: Canvas, width, height):
+        self.__draw_border(canvas, width, height)
+        canvas.line(A4[0] - 190 * mm, 45 * mm, A4[0] - 5 * mm, 45 * mm)
+        canvas.line(A4[0] - 190 * mm, 30 * mm, A4[0] - 5 * mm, 30 * mm)
+
+        canvas.line(A4[0] - 125 * mm, 40 * mm, A4[0] - 190 * mm, 40 * mm)
+        canvas.line(A4[0] - 125 * mm, 35 * mm, A4[0] - 190 * mm, 35 * mm)
+        canvas.line(A4[0] - 125 * mm, 30 * mm, A4[0] - 190 * mm, 30 * mm)
+        canvas.line(A4[0] - 125 * mm, 25 * mm, A4[0] - 190 * mm, 25 * mm)
+        canvas.line(A4[0] - 125 * mm, 20 * mm, A4[0] - 190 * mm, 20 * mm)
+        canvas.line(A4[0] - 125 * mm, 15 * mm, A4[0] - 190 * mm, 15 * mm)
+        canvas.line(A4[0] - 125 * mm, 10 * mm, A4[0] - 190 * mm, 10 * mm)
+
+        canvas.line(A4[0] - 125 * mm, 5 * mm, A4[0] - 125 * mm, 45 * mm)
+        canvas.line(A4[0] - 135 * mm, 5 * mm, A4[0] - 135 * mm, 45 * mm)
+        canvas.line(A4[0] - 150 * mm, 5 * mm, A4[0] - 150 * mm, 45 * mm)
+        canvas.line(A4[0] - 173 * mm, 5 * mm, A4[0] - 173 * mm, 45 * mm)
+
+        canvas.line(A4[0] - 183 * mm, 30 * mm, A4[0] - 183 * mm, 45 * mm)
+
+        canvas.drawString(A4[0] - 134 * mm, 31 * mm, 'Дата')
+        canvas.drawString(A4[0] - 149 * mm, 31 * mm, 'Подп.')
+        canvas.drawString(A4[0] - 172 * mm, 31 * mm, '№ докум.')
+        canvas.drawString(A4[0] - 182 * mm, 31 * mm, 'Лист')
+        canvas.drawString(A4[0] - 190 * mm, 31 * mm, 'Изм.')
+
+        canvas.drawString(A4[0] - 189 * mm, 26 * mm, 'Разраб.')
+        canvas.drawString(A4[0] - 189 * mm, 21 * mm, 'Пров.')
+        canvas.drawString(A4[0] - 189 * mm, 11 * mm, 'Н. контр.')
+        canvas.drawString(A4[0] - 189 * mm, 6 * mm, 'Утв.')
+
+        canvas.line(A4[0] - 55 * mm, 20 * mm, A4[0] - 5 * mm, 20 * mm)
+        canvas.line(A4[0] - 55 * mm, 25 * mm, A4[0] - 5 * mm, 25 * mm)
+
+        canvas.line(A4[0] - 55 * mm, 5 * mm, A4[0] - 55 * mm, 30 * mm)
+        canvas.line(A4[0] - 40 * mm, 20 * mm, A4[0] - 40 * mm, 30 * mm)
+        canvas.line(A4[0] - 25 * mm, 20 * mm, A4[0] - 25 * mm, 30 * mm)
+
+        canvas.drawString(A4[0] - 54 * mm, 26 * mm, 'Лит.')
+        canvas.drawString(A4[0] - 39 * mm, 26 * mm, 'Лист')
+        canvas.drawCentredString(A4[0] - 15 * mm, 26 * mm, 'Листов')
+        self.__draw_footer(canvas, width)
+
+    def __draw_sheet(self, canvas: Canvas, width, height):
+        self.__draw_border(canvas, width, height)
+        canvas.line(width - 190 * mm, 20 * mm, width - 5 * mm, 20 * mm)
+        canvas.line(width - 15 * mm, 13 * mm, width - 5 * mm, 13 * mm)
+
+        canvas.line(width - 190 * mm, 5 * mm, width - 190 * mm, 20 * mm)
+
+        canvas.line(width - 15 * mm, 5 * mm, width - 15 * mm, 20 * mm)
+        canvas.drawString(width - 14 * mm, 15 * mm, 'Лист')
+
+        canvas.line(width - 125 * mm, 5 * mm, width - 125 * mm, 20 * mm)
+        canvas.line(width - 135 * mm, 5 * mm, width - 135 * mm, 20 * mm)
+        canvas.line(width - 150 * mm, 5 * mm, width - 150 * mm, 20 * mm)
+        canvas.line(width - 173 * mm, 5 * mm, width - 173 * mm, 20 * mm)
+        canvas.line(width - 183 * mm, 5 * mm, width - 183 * mm, 20 * mm)
+
+        canvas.line(width - 190 * mm, 10 * mm, width - 125 * mm, 10 * mm)
+        canvas.line(width - 190 * mm, 15 * mm, width - 125 * mm, 15 * mm)
+
+        canvas.drawString(width - 134 * mm, 6 * mm, 'Дата')
+        canvas.drawString(width - 149 * mm, 6 * mm, 'Подп.')
+        canvas.drawString(width - 172 * mm, 6 * mm, '№ докум.')
+        canvas.drawString(width - 182 * mm, 6 * mm, 'Лист')
+        canvas.drawString(width - 190 * mm, 6 * mm, 'Изм.')
+        self.__draw_footer(canvas, width)
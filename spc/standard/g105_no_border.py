@@ -12,9 +12,10 @@ from spc.standard.doc import SPCDocument, SPCChapter, SPCTable, SPCTitle, SPCLis
 
 
 class G105Image(SPCImage):
+    caption_format = 'Рисунок {index} - {caption}'
+
     def __init__(self, caption, filename, reference, image_index):
         super().__init__(caption=caption, filename=filename, reference=reference, image_index=image_index)
-        self.caption = f'Рисунок {image_index} - {caption}'
         self.caption_alignment = TA_CENTER
 
 
@@ -25,6 +26,8 @@ class G105Title(SPCTitle):
         self.__agrees = agrees
 
     def build(self, font_name, font_size):
+        # built on every pass, the list of the project is not changed
+        agrees = list(self.__agrees or [])
         style = ParagraphStyle(name='title', fontName=font_name, fontSize=font_size, alignment=TA_CENTER,
                                spaceAfter=10 * mm)
         company = Paragraph(f'{self.company}', style=style)
@@ -32,8 +35,8 @@ class G105Title(SPCTitle):
             data = [['Утвержден', ''], [self.__approve, '']]
         else:
             data = [['СОГЛАСОВАНО', 'УТВЕРЖДАЮ'],
-                    [self.__agrees[0].job_name, self.__approve.job_name],
-                    [f'__________ {self.__agrees[0].name}', f'__________ {self.__approve.name}'],
+                    [agrees[0].job_name, self.__approve.job_name],
+                    [f'__________ {agrees[0].name}', f'__________ {self.__approve.name}'],
                     ['(подпись)', '(подпись)']]
         approve = Table(data, hAlign='CENTER', colWidths=(A4[0] - 40 * mm)/2, spaceAfter=10 * mm, style=TableStyle(
             [
@@ -43,12 +46,12 @@ class G105Title(SPCTitle):
         ))
 
         end = [PageBreak()]
-        if not isinstance(self.__approve, str) and len(self.__agrees) > 1:
+        if not isinstance(self.__approve, str) and len(agrees) > 1:
             data = [
                 ['СОГЛАСОВАНО', '']
             ]
-            if (len(self.__agrees) - 1) % 2:
-                self.__agrees.append(TitleApprove(**{'name': '', 'job_name': ''}))
+            if (len(agrees) - 1) % 2:
+                agrees.append(TitleApprove(**{'name': '', 'job_name': ''}))
 
             tableStyle = TableStyle(
                 [
@@ -57,7 +60,7 @@ class G105Title(SPCTitle):
                     # ('ALIGN', (0, 19), (1, 19), 'CENTER')
                 ]
             )
-            for index in range(1, len(self.__agrees)-1, 2):
+            for index in range(1, len(agrees)-1, 2):
                 if index == 13:
                     data.append(['', ''])
                     data.append(['Продолжение на следующем листе', ''])
@@ -66,16 +69,16 @@ class G105Title(SPCTitle):
                     tableStyle.add('ALIGN', (0, int(index / 2) * 3 + 2), (1, int(index / 2) * 3 + 2), 'CENTER')
                     tableStyle.add('SPAN', (0, int(index / 2) * 3 + 3), (1, int(index / 2) * 3 + 3))
                     tableStyle.add('ALIGN', (0, int(index / 2) * 3 + 3), (1, int(index / 2) * 3 + 3), 'CENTER')
-                if len(self.__agrees[index+1].job_name):
-                    data.append([self.__agrees[index].job_name, self.__agrees[index + 1].job_name])
-                    data.append([f'__________ {self.__agrees[index].name}', f'__________ {self.__agrees[index+1].name}'])
+                if len(agrees[index+1].job_name):
+                    data.append([agrees[index].job_name, agrees[index + 1].job_name])
+                    data.append([f'__________ {agrees[index].name}', f'__________ {agrees[index+1].name}'])
                     data.append(['(подпись)', '(подпись)'])
                 else:
-                    data.append([self.__agrees[index].job_name, ''])
-                    data.append([f'_________ {self.__agrees[index].name}', ''])
+                    data.append([agrees[index].job_name, ''])
+                    data.append([f'_________ {agrees[index].name}', ''])
                     data.append(['(подпись)', ''])
             table = Table(data, colWidths=(A4[0] - 40 * mm)/2, style=tableStyle)
-            if len(self.__agrees) > 12:
+            if len(agrees) > 12:
                 end = [NextPageTemplate('portrait'), table, PageBreak('portrait')]
             else:
                 end = [table, PageBreak('portrait')]
@@ -99,11 +102,16 @@ class G105Table(SPCTable):
 
         return items
 
+    def continuation(self, font_name, font_size):
+        return Paragraph(f'Продолжение таблицы {self.table_index}',
+                         style=ParagraphStyle(name='', fontName=font_name, fontSize=font_size, spaceAfter=6))
+
 
 class G105Chapter(SPCChapter):
     def __init__(self, level, text, index):
         super().__init__(level, text, TA_LEFT)
         self.text = f'{index} {text}'
+        self.number = index
         self.indent = 15 * mm
 
     def replace_special(self):
@@ -125,7 +133,7 @@ class G105List(SPCList):
 
 class G105NoBorderDoc(SPCDocument):
     def __init__(self, filename, font, font_family, debug=False):
-        super().__init__(filename, font, font_family)
+        super().__init__(filename, font, font_family, debug)
 
         pageTemplates = [
             PageTemplate(id='portrait', frames=[
@@ -140,20 +148,17 @@ class G105NoBorderDoc(SPCDocument):
     def check(self, item):
         return True
 
-    def save(self):
-        for item in self.items:
-            item.replace_special()
-        super().save()
-
     def onPage(self, canvas, doc):
+        if self.pageTemplate.id == 'portrait':
+            self.mark_page(canvas, A4[0], A4[1])
+        else:
+            self.mark_page(canvas, A4[1], A4[0])
+
+    def draw_page_number(self, canvas, number, width, height):
         canvas.saveState()
 
-        if doc.page > 1:
-            if self.pageTemplate.id == 'portrait':
-                x = A4[0]
-            else:
-                x = A4[1]
+        if number > 1:
             canvas.setFont(self.font_name, 12)
-            canvas.drawString(x / 2, 5 * mm, f'{doc.page}')
+            canvas.drawString(width / 2, 5 * mm, f'{number}')
 
         canvas.restoreState()
@@ -10,13 +10,15 @@ from reportlab.platypus import PageTemplate, Frame, Paragraph, PageBreak, Table,
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
 from reportlab.platypus.tableofcontents import SimpleIndex
 
-from spc.standard.doc import SPCDocument, SPCChapter, SPCTitle, SPCItem, SPCList, SPCImage, TotalPage
+from spc.standard.doc import SPCDocument, SPCChapter, SPCTitle, SPCItem, SPCList, SPCImage, TotalPage, \
+    draw_form, MeasuredTable
 
 
 class G19Image(SPCImage):
+    caption_format = 'Рисунок {index} - {caption}'
+
     def __init__(self, caption, filename, reference, image_index):
         super().__init__(caption, filename, reference, image_index)
-        self.caption = f'Рисунок {image_index} - {caption}'
         self.caption_alignment = TA_CENTER
 
 
@@ -33,6 +35,7 @@ class G19Chapter(SPCChapter):
     def __init__(self, level, text, index):
         super().__init__(level, text, TA_LEFT)
         self.text = f'{index} {text}'
+        self.number = index
         self.indent = 10 * mm
 
     def replace_special(self):
@@ -60,7 +63,7 @@ class G19Specification(SPCItem):
         # for row in self.__data:
         #     if row[1] in specials:
 
-        table = Table(self.__data, colWidths=[80 * mm, 70 * mm, 30 * mm], style=style_table, repeatRows=1)
+        table = MeasuredTable(self.__data, colWidths=[80 * mm, 70 * mm, 30 * mm], style=style_table, repeatRows=1)
         result = [table]
         return result
 
@@ -244,6 +247,8 @@ class G19Title(SPCTitle):
 
 
 class G19Appendix(SPCItem):
+    heading = True
+
     def __init__(self, caption, appendix_index):
         super().__init__()
         self.appendix_index = appendix_index
@@ -258,7 +263,7 @@ class G19Appendix(SPCItem):
 
 class G19(SPCDocument):
     def __init__(self, filename, font, font_family, debug):
-        super().__init__(filename, font, font_family)
+        super().__init__(filename, font, font_family, debug)
 
         pageTemplates = [
             PageTemplate(id='title', frames=[
@@ -286,64 +291,57 @@ class G19(SPCDocument):
         self.addPageTemplates(pageTemplates=pageTemplates)
 
         self.__doc_type = ''
-        self.__page_count = 0
-        self.__pass = 0
-        self.setProgressCallBack(self.onProgress)
-
-    def onProgress(self, param, value):
-        print(f'{param} - {value}')
-        if param == 'PASS':
-            self.__pass = value
-        elif param == 'PAGE' and self.__pass == 1:
-            self.__page_count = value
-        elif param == 'FINISHED':
-            for item in self.flowable:
-                if isinstance(item, TotalPage):
-                    item.page_count = self.__page_count
 
     def check(self, item):
         if isinstance(item, G19Title):
             self.__doc_type = item.document_type
         return True
 
-    def save(self):
-        if not isinstance(self.items[0], G19NotificationSheet):
+    def save(self, jobs=None):
+        # a document saved again has the sheet already
+        if not isinstance(self.items[0], G19NotificationSheet) and \
+                not isinstance(self.items[-1], G19ChangeRegistrationSheet):
             self.append(G19ChangeRegistrationSheet())
-        for item in self.items:
-            item.replace_special()
-        print('save')
-        super().save()
-
-    def beforeDocument(self):
-        print('beforeDocument')
+        super().save(jobs)
 
     def onPage(self, canvas, doc):
         width = A4[0]
         height = A4[1]
 
-        if doc.page == 1:
-            font_name = tt2ps(self.font_name, 0, 1)
-            canvas.setFont(font_name, 10)
-            # left stamp
-            canvas.line(20 * mm, 5 * mm, 20 * mm, 150 * mm)
-            canvas.line(13 * mm, 5 * mm, 13 * mm, 150 * mm)
-            canvas.line(8 * mm, 5 * mm, 8 * mm, 150 * mm)
-
-            canvas.line(8 * mm, 5 * mm, 20 * mm, 5 * mm)
-            canvas.line(8 * mm, 30 * mm, 20 * mm, 30 * mm)
-            canvas.line(8 * mm, 65 * mm, 20 * mm, 65 * mm)
-            canvas.line(8 * mm, 90 * mm, 20 * mm, 90 * mm)
-            canvas.line(8 * mm, 115 * mm, 20 * mm, 115 * mm)
-            canvas.line(8 * mm, 150 * mm, 20 * mm, 150 * mm)
-
-            canvas.rotate(90)
-            canvas.drawString(20, -35, 'Инв. № подп.')
-            canvas.drawString(90, -35, 'Подп. и дата')
-            canvas.drawString(190, -35, 'Взам. инв. №')
-            canvas.drawString(260, -35, 'Инв. № дубл.')
-            canvas.drawString(330, -35, 'Подп. и дата')
-            canvas.rotate(-90)
+        if self.page_style(self.page_number) == 'title':
+            draw_form(canvas, 'G19LeftStamp', self.__draw_left_stamp)
         else:
+            self.mark_page(canvas, width, height)
             canvas.setFont(self.font_name, 12)
-            canvas.drawString(width/2, height-15, str(doc.page))
             canvas.drawCentredString(width / 2, height - 25, self.__doc_type)
+
+    def page_style(self, number):
+        return 'title' if number == 1 else None
+
+    def draw_page_number(self, canvas, number, width, height):
+        if number > 1:
+            canvas.setFont(self.font_name, 12)
+            canvas.drawString(width/2, height-15, str(number))
+
+    def __draw_left_stamp(self, canvas):
+        font_name = tt2ps(self.font_name, 0, 1)
+        canvas.setFont(font_name, 10)
+        # left stamp
+        canvas.line(20 * mm, 5 * mm, 20 * mm, 150 * mm)
+        canvas.line(13 * mm, 5 * mm, 13 * mm, 150 * mm)
+        canvas.line(8 * mm, 5 * mm, 8 * mm, 150 * mm)
+
+        canvas.line(8 * mm, 5 * mm, 20 * mm, 5 * mm)
+        canvas.line(8 * mm, 30 * mm, 20 * mm, 30 * mm)
+        canvas.line(8 * mm, 65 * mm, 20 * mm, 65 * mm)
+        canvas.line(8 * mm, 90 * mm, 20 * mm, 90 * mm)
+        canvas.line(8 * mm, 115 * mm, 20 * mm, 115 * mm)
+        canvas.line(8 * mm, 150 * mm, 20 * mm, 150 * mm)
+
+        canvas.rotate(90)
+        canvas.drawString(20, -35, 'Инв. № подп.')
+        canvas.drawString(90, -35, 'Подп. и дата')
+        canvas.drawString(190, -35, 'Взам. инв. №')
+        canvas.drawString(260, -35, 'Инв. № дубл.')
+        canvas.drawString(330, -35, 'Подп. и дата')
+        canvas.rotate(-90)
@@ -0,0 +1,92 @@
+import re
+
+from reportlab.platypus import PageBreak
+
+
+class MacroRegistry:
+    # %name and %name(argument) macros found with one precompiled pattern.
+    # Inline macros are replaced in the text, a paragraph with a block macro is replaced by its flowables
+    def __init__(self):
+        self.__inline = {}
+        self.__blocks = {}
+        self.__pattern = None
+
+    def __compile(self):
+        # longer names first, so %pagebreak is never taken for a shorter macro
+        names = sorted(list(self.__inline) + list(self.__blocks), key=len, reverse=True)
+        self.__pattern = re.compile(r'%(' + '|'.join(map(re.escape, names)) + r')(?:\(([\w.,*%]+)\))?')
+
+    @property
+    def pattern(self):
+        if self.__pattern is None:
+            self.__compile()
+        return self.__pattern
+
+    def register(self, name, handler):
+        # handler(argument, on_replace) returns the replacement text or None to keep the macro
+        self.__inline[name] = handler
+        self.__pattern = None
+
+    def register_block(self, name, factory):
+        # factory() returns the flowables put instead of the paragraph
+        self.__blocks[name] = factory
+        self.__pattern = None
+
+    def blocks(self, text):
+        if '%' not in text:
+            return []
+        return [flowable for match in self.pattern.finditer(text) if match.group(1) in self.__blocks
+                for flowable in self.__blocks[match.group(1)]()]
+
+    def expand(self, text, on_replace=None, missing=None):
+        # an inline macro its handler can not expand is kept, or replaced by missing if given
+        if '%' not in text:
+            return text
+
+        def replace(match):
+            handler = self.__inline.get(match.group(1))
+            if handler is None:
+                return match.group(0)
+            result = handler(match.group(2), on_replace)
+            if result is None:
+                return match.group(0) if missing is None else missing
+            return result
+
+        return self.pattern.sub(replace, text)
+
+    def take(self, text, name):
+        # the text without the first use of the macro, and its argument
+        for match in self.pattern.finditer(text):
+            if match.group(1) == name and match.group(2):
+                return text[:match.start()].rstrip() + text[match.end():], match.group(2)
+        return text, None
+
+    def find(self, text, name):
+        # first use of the macro as (text before it, argument)
+        for match in self.pattern.finditer(text):
+            if match.group(1) == name:
+                return text[:match.start()], match.group(2)
+        return None
+
+
+def _ref(label, on_replace):
+    # an unknown label is kept for the expansion at layout time
+    value = on_replace(label) if label and on_replace else None
+    if value is None:
+        return None
+    return f'<a href="#{label}">{value}</a>'
+
+
+def _label(label, on_replace):
+    return f'<a name="{label}"/>' if label else None
+
+
+macros = MacroRegistry()
+macros.register('ref', _ref)
+# captions and headings take the label out themselves, elsewhere it becomes an anchor
+macros.register('label', _label)
+# widths of the columns in the caption of a table, taken out by the table
+macros.register('widths', lambda widths, on_replace: '')
+macros.register_block('landscape', lambda: [PageBreak('landscape')])
+macros.register_block('portrait', lambda: [PageBreak('portrait')])
+macros.register_block('pagebreak', lambda: [PageBreak()])
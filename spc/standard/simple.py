@@ -4,7 +4,7 @@ from reportlab.lib.units import mm
 from reportlab.platypus import PageTemplate, Frame, Paragraph, PageBreak
 from reportlab.lib.enums import TA_CENTER
 
-from spc.standard.doc import SPCDocument, SPCTitle, SPCPageTemplate, SPCTableOfContent
+from spc.standard.doc import SPCDocument, SPCTitle, SPCPageTemplate, SPCTableOfContent, SPCList, SPCTable
 
 
 class SimpleTitle(SPCTitle):
@@ -16,9 +16,30 @@ class SimpleTitle(SPCTitle):
         return [Paragraph(f'{self.caption}', style=style), PageBreak()]
 
 
+class SimpleList(SPCList):
+    def __init__(self, start, sub_list=0):
+        super().__init__(start, '.', False, sub_list)
+
+    def get_letter(self, index):
+        return index
+
+
+class SimpleTable(SPCTable):
+    def __init__(self, header, format_columns, index):
+        super().__init__(header, index, format_columns)
+
+    def build(self, font_name, font_size):
+        items = []
+        if self.caption:
+            text = f'{self.caption}<a name=\"{self.label}\"/>'
+            items.append(Paragraph(text, style=ParagraphStyle(name='', fontName=font_name, fontSize=font_size,
+                                                              spaceBefore=6, spaceAfter=6)))
+        return items + super().build(font_name, font_size)
+
+
 class SimpleDoc(SPCDocument):
     def __init__(self, filename, font, font_family, debug=False):
-        super().__init__(filename, font, font_family)
+        super().__init__(filename, font, font_family, debug)
         pageTemplates = [
             PageTemplate(id='portrait', frames=[
                 Frame(20 * mm, 15 * mm, A4[0] - 25 * mm, A4[1] - 30 * mm, showBoundary=debug)
@@ -31,8 +52,11 @@ class SimpleDoc(SPCDocument):
         return True
 
     def onPage(self, canvas, doc):
+        self.mark_page(canvas, A4[0], A4[1])
+
+    def draw_page_number(self, canvas, number, width, height):
         canvas.saveState()
 
-        canvas.drawString(A4[0] / 2, 5 * mm, f'{doc.page}')
+        canvas.drawString(width / 2, 5 * mm, f'{number}')
 
         canvas.restoreState()
@@ -1,15 +1,88 @@
 import argparse
+import signal
+import sys
 
 from spc import SimplePDFCreate
+from spc.batch import build_batch, expand_projects
+
+
+class ProgressRenderer:
+    # phases and passes on their own lines, the page counter is rewritten in place
+    def __init__(self):
+        self.__page_line = False
+
+    def __print(self, text):
+        if self.__page_line:
+            print()
+            self.__page_line = False
+        print(text, flush=True)
+
+    def __call__(self, event):
+        if event.kind == 'phase_end':
+            self.__print(f'{event.name}: {event.elapsed:.2f}s')
+        elif event.kind == 'pass':
+            self.__print(f'pass {event.number}')
+        elif event.kind == 'page':
+            print(f'\rpage {event.page}', end='', flush=True)
+            self.__page_line = True
+        elif event.kind == 'segment':
+            self.__print(f'segment {event.index}: {event.pages} pages, {event.elapsed:.2f}s')
+        elif event.kind == 'unresolved':
+            self.__print(f'unresolved references: {", ".join(event.labels)}')
+
+
+def print_result(result):
+    if result.ok:
+        print(f'{result.filename}: {result.pages} pages, {result.elapsed:.2f}s -> {result.output}')
+    else:
+        print(f'{result.filename}: FAILED after {result.elapsed:.2f}s: {result.error}')
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--filename', type=str, required=True, help="load project")
-    parser.add_argument('--noprogress', default=False, help="disable progress message")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--filename', type=str, help="load project")
+    group.add_argument('--batch', type=str, nargs='+', help="load projects, file names or glob patterns")
+    group.add_argument('--serve', action='store_true', help="render jobs sent over http by a pool of warm workers")
+    group.add_argument('--clear-cache', action='store_true', help="remove the parsed sources, fonts and images "
+                                                                  "cached on disk")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes for --batch and --serve, "
+                                                               "default cpu count. With --filename the segments "
+                                                               "of the document are laid out in parallel")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="address for --serve")
+    parser.add_argument('--port', type=int, default=8765, help="port for --serve")
+    parser.add_argument('--socket', type=str, default=None, help="unix socket for --serve instead of the port")
+    parser.add_argument('--warm', type=str, default=None, help="project whose font family the --serve workers "
+                                                              "load before the first job, default the fonts in font/")
+    parser.add_argument('--noprogress', action='store_true', help="disable progress message")
     args = parser.parse_args()
 
-    spc = SimplePDFCreate()
+    if args.clear_cache:
+        from spc.cache import clear_cache
+        path = clear_cache()
+        print(f'cleared {path}' if path else 'the disk cache is disabled')
+        sys.exit(0)
+
+    if args.serve:
+        from spc.server import project_fonts, serve
+        # stopping the service removes the socket and the workers the same way as ctrl+c
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        address = args.socket or f'http://{args.host}:{args.port}'
+        try:
+            serve(args.host, args.port, args.socket, args.jobs, project_fonts(args.warm) if args.warm else None,
+                  on_ready=lambda server: print(f'serving on {address}', flush=True))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.batch:
+        results = build_batch(expand_projects(args.batch), args.jobs, print_result)
+        failed = [result for result in results if not result.ok]
+        print(f'done: {len(results) - len(failed)} built, {len(failed)} failed, '
+              f'{sum(result.pages for result in results)} pages')
+        sys.exit(1 if failed else 0)
+
+    spc = SimplePDFCreate(None if args.noprogress else ProgressRenderer())
     doc = spc.load(args.filename)
-    print(f'save document')
-    doc.save()
-    print(f'done')
+    doc.save(args.jobs)
+    print(f'done: {doc.page_count} pages, {doc.passes} passes')
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def session_cache_dir(tmp_path_factory):
+    # the workers and commands started by the tests inherit it, the cache of the user is never touched
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('SPC_CACHE_DIR', str(tmp_path_factory.mktemp('cache')))
+        yield
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # a test does not find the cache warmed by the one before
+    monkeypatch.setenv('SPC_CACHE_DIR', str(tmp_path / 'cache'))
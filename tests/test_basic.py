@@ -1,9 +1,28 @@
+import gc
+import io
+import os
+import tempfile
 import unittest
+import weakref
+from collections import OrderedDict
+from unittest import mock
 
-from spc.core import SimplePDFCreate
-from spc.standard.doc import SPCTable
+import yaml
+
+from benchmarks.generate import SIZES, STANDARDS, Size, generate
+from spc import core
+from spc.cache import clear_cache
+from spc.core import SimplePDFCreate, parse_project
+from spc.standard.doc import SPCTable, SPCImage, SPCParagraph
+from spc.spc_yaml import TitleApprove
+from spc.standard.g105_no_border import G105Title
 from spc.standard.simple import SimpleTitle
 
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
 
 class MyTestCase(unittest.TestCase):
     # def test_create(self):
@@ -25,12 +44,14 @@ class MyTestCase(unittest.TestCase):
     #     doc.save()
 
     def test_load(self):
-        spc = SimplePDFCreate()
-        # doc = spc.load('test.yaml')
-        # doc.append(SPCTable())
-        doc = spc.load('ИМЕС.00300-04 51-XX.yaml')
-        # doc = spc.load('ИМЕС.00300-03_01.yaml')
-        doc.save()
+        # a generated project instead of a document that is not in the repository
+        with tempfile.TemporaryDirectory() as directory:
+            for standard in STANDARDS:
+                with self.subTest(standard=standard):
+                    doc = SimplePDFCreate().load(generate(directory, standard, SIZES['small']))
+                    doc.save()
+                    self.assertGreater(doc.page_count, 1)
+                    self.assertTrue(os.path.getsize(doc.filename))
         # font = {'Times New Roman': 'Times New Roman.ttf'}
         # doc = spc.create_document('test.pdf', font)
         #
@@ -38,6 +59,243 @@ class MyTestCase(unittest.TestCase):
         #
         # doc.load('test.yaml')
 
+    def test_parse_project(self):
+        # an unchanged project is parsed and validated once per process
+        with tempfile.TemporaryDirectory() as directory:
+            with open(generate(directory, 'g2', SIZES['small']), encoding='utf-8') as file:
+                project = file.read()
+        spc = parse_project(project)
+        again = parse_project(project.encode('utf-8'))
+        # the cached model is copied, a loader changing it does not change the next project
+        self.assertIsNot(again, spc)
+        self.assertEqual(again, spc)
+        spc.title.agrees.clear()
+        self.assertEqual(len(parse_project(project).title.agrees), 2)
+        # an int would be opened as a file descriptor
+        with self.assertRaises(TypeError):
+            parse_project(5)
+
+    def test_title_build_again(self):
+        # the title is built on every pass, its approvers stay as in the project
+        agrees = [TitleApprove(name='И.И. Иванов', job_name='Руководитель отдела'),
+                  TitleApprove(name='П.П. Петров', job_name='Руководитель проекта')]
+        approve = TitleApprove(name='С.С. Сидоров', job_name='Директор')
+        title = G105Title('Company', 'Caption', 'Doc', approve, agrees)
+        first, second = title.build('Helvetica', 10), title.build('Helvetica', 10)
+        self.assertEqual(len(agrees), 2)
+        self.assertEqual(first[-2]._cellvalues, second[-2]._cellvalues)
+
+    def test_shared_source(self):
+        # a markdown file converted once is numbered for every place it is used in
+        with tempfile.TemporaryDirectory() as directory:
+            with open(generate(directory, 'g2', SIZES['small']), encoding='utf-8') as file:
+                project = yaml.safe_load(file)
+            files = {}
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), 'rb') as file:
+                    files[name] = file.read()
+        files['first.md'] = '# Первый\n\n![first](image1_1.png "первый")\n\n| a |\n|---|\n| 1 |\n'.encode()
+        files['shared.md'] = '# Общий\n\n![shared](image2_1.png "общий")\n\n| b |\n|---|\n| 2 |\n'.encode()
+        project['spc']['appendixes'] = []
+
+        def items(*names):
+            project['spc']['items'] = [{'type': 'markdown', 'name': name} for name in names]
+            return list(SimplePDFCreate().loads(project, files).items)
+
+        items('shared.md')
+        loaded = items('first.md', 'shared.md')
+        self.assertEqual([item.table_index for item in loaded if isinstance(item, SPCTable)], [1, 2])
+        images = [item for item in loaded if isinstance(item, SPCImage)]
+        self.assertEqual(images[1].caption, 'Рисунок 2 - общий')
+        self.assertEqual(images[1].filename, files['image2_1.png'])
+
+    def test_converted_cache(self):
+        # an unchanged markdown file is converted once and read from the disk cache by a new process
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache:
+            filename = generate(directory, 'g2', SIZES['small'])
+            with mock.patch.dict(os.environ, {'SPC_CACHE_DIR': cache}):
+                # converted by this test, not taken from the memory of an earlier one
+                with mock.patch.object(core, '_converted', OrderedDict()):
+                    first = [item.__class__.__name__ for item in SimplePDFCreate().load(filename).items]
+                self.assertTrue(os.listdir(os.path.join(cache, 'converted')))
+                with mock.patch.object(core, '_converted', OrderedDict()), \
+                        mock.patch.object(core, '_markdown_chunks', side_effect=AssertionError):
+                    again = [item.__class__.__name__ for item in SimplePDFCreate().load(filename).items]
+                self.assertEqual(again, first)
+
+                with open(os.path.join(directory, 'chapter1.md'), 'a', encoding='utf-8') as file:
+                    file.write('\nИзмененный абзац\n')
+                with mock.patch.object(core, '_markdown_chunks', wraps=core._markdown_chunks) as chunks:
+                    changed = SimplePDFCreate().load(filename).items
+                self.assertEqual(chunks.call_count, 1)
+                self.assertEqual(len(changed), len(first) + 1)
+
+    def test_clear_cache(self):
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache:
+            with mock.patch.dict(os.environ, {'SPC_CACHE_DIR': cache}):
+                SimplePDFCreate().load(generate(directory, 'g2', SIZES['small'])).save()
+                self.assertTrue(os.listdir(cache))
+                self.assertEqual(clear_cache(), cache)
+                self.assertFalse(os.path.exists(cache))
+            with mock.patch.dict(os.environ, {'SPC_CACHE_DIR': ''}):
+                self.assertIsNone(clear_cache())
+
+    def test_shared_table_file(self):
+        # a streamed table converted for one project reads its rows from the file of the next one
+        size = Size(chapters=1, tables=1, rows=SPCTable.chunk_threshold + 10, images=0, list_depth=1)
+        with tempfile.TemporaryDirectory() as second:
+            with tempfile.TemporaryDirectory() as first:
+                SimplePDFCreate().load(generate(first, 'simple', size))
+            doc = SimplePDFCreate().load(generate(second, 'simple', size))
+            self.assertTrue(doc.save_bytes().startswith(b'%PDF'))
+
+    def test_markdown_released(self):
+        # a markdown file is parsed chapter by chapter, the tree of a chapter is dropped before the next one
+        alive = []
+        markdown_chunks = core._markdown_chunks
+
+        def chunks(filename):
+            parsed = []
+            for document in markdown_chunks(filename):
+                gc.collect()
+                # the loop of the loader still holds the chapter it has finished
+                alive.append(sum(ref() is not None for ref in parsed[:-1]))
+                parsed.append(weakref.ref(document))
+                yield document
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = generate(directory, 'g2', Size(chapters=5, tables=1, rows=3, images=1, list_depth=1))
+            with mock.patch.object(core, '_converted', OrderedDict()), \
+                    mock.patch.object(core, '_markdown_chunks', chunks):
+                SimplePDFCreate().load(filename)
+        self.assertGreater(len(alive), 5)
+        self.assertEqual(set(alive), {0})
+
+    @unittest.skipIf(PdfReader is None, 'pypdf is not installed')
+    def test_references(self):
+        # labels of every kind are known to the whole document, a reference may come before its label
+        with tempfile.TemporaryDirectory() as directory:
+            with open(generate(directory, 'g2', SIZES['small']), encoding='utf-8') as file:
+                project = yaml.safe_load(file)
+            files = {}
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), 'rb') as file:
+                    files[name] = file.read()
+        files['chapters.md'] = (
+            '# Первый %label(first)\n\n'
+            'См. раздел %ref(second), приложение %ref(app), раздел %ref(appchapter), таблицу %ref(tab), '
+            'рисунок %ref(pic), пункт %ref(point) и %ref(missing).\n\n'
+            '- Без номера %label(bullet)\n\n'
+            '1. Пункт один\n2. Пункт два %label(point)\n\n'
+            '| a |\n|---|\n| 1 |\n\n: Таблица %label(tab)\n\n'
+            '![pic](image1_1.png "Картинка")\n\n'
+            '# Второй %label(second)\n\nСм. раздел %ref(first).\n').encode()
+        files['appendix.md'] = '# Раздел приложения %label(appchapter)\n\nТекст.\n'.encode()
+        project['spc']['items'] = [{'type': 'markdown', 'name': 'chapters.md'}]
+        project['spc']['appendixes'] = [{'caption': 'Данные %label(app)', 'type': 'справочное',
+                                         'items': [{'type': 'markdown', 'name': 'appendix.md'}]}]
+        events = []
+        with self.assertLogs('spc', 'WARNING') as logs:
+            doc = SimplePDFCreate(events.append).loads(project, files)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('bullet', logs.output[0])
+        pdf = doc.save_bytes()
+
+        text = ' '.join(' '.join(page.extract_text() for page in PdfReader(io.BytesIO(pdf)).pages).split())
+        self.assertIn('См. раздел 2, приложение А, раздел А.1, таблицу 1, рисунок 1, пункт b и ??.', text)
+        self.assertIn('См. раздел 1.', text)
+        self.assertEqual([event.labels for event in events if event.kind == 'unresolved'], [['missing']])
+
+    def test_loads(self):
+        # the project and its files from memory, the pdf is returned and nothing is written
+        with tempfile.TemporaryDirectory() as directory:
+            filename = generate(directory, 'g2', SIZES['small'])
+            with open(filename, encoding='utf-8') as file:
+                project = file.read()
+            files = {}
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), 'rb') as file:
+                    files[name] = file.read()
+            doc = SimplePDFCreate().loads(project, files)
+            pdf = doc.save_bytes()
+            self.assertTrue(pdf.startswith(b'%PDF'))
+            self.assertFalse(os.path.exists(os.path.join(directory, 'out_g2.pdf')))
+
+            disk = SimplePDFCreate().load(filename)
+            disk.save()
+            self.assertEqual(doc.page_count, disk.page_count)
+            with self.assertRaises(FileNotFoundError):
+                SimplePDFCreate().loads(project, {})
+
+    def test_flowables_released(self):
+        # the flowables of an item live until they are laid out, the items stay with the document
+        made, alive = [], []
+        build = SPCParagraph.build
+
+        def record(item, font_name, font_size):
+            flowables = build(item, font_name, font_size)
+            made.extend(weakref.ref(flowable) for flowable in flowables)
+            return flowables
+
+        def on_event(event):
+            if event.kind == 'page':
+                gc.collect()
+                alive.append(sum(ref() is not None for ref in made))
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = generate(directory, 'g2', Size(chapters=10, tables=0, rows=0, images=0, list_depth=1))
+            doc = SimplePDFCreate(on_event).load(filename)
+            with mock.patch.object(SPCParagraph, 'build', record):
+                doc.save()
+        self.assertGreater(len(made), 50)
+        self.assertLess(max(alive), len(made) / 4)
+        self.assertTrue(any(isinstance(item, SPCParagraph) for item in doc.items))
+
+    @unittest.skipIf(PdfReader is None, 'pypdf is not installed')
+    def test_save_again(self):
+        # a render service saves the same document more than once
+        with tempfile.TemporaryDirectory() as directory:
+            for standard in STANDARDS:
+                with self.subTest(standard=standard):
+                    doc = SimplePDFCreate().load(generate(directory, standard, SIZES['small']))
+                    pages = []
+                    for pdf in (doc.save_bytes(), doc.save_bytes()):
+                        pages.append([page.extract_text() for page in PdfReader(io.BytesIO(pdf)).pages])
+                        self.assertEqual(doc.page_count, len(pages[-1]))
+                    doc.save()
+                    self.assertEqual(len(PdfReader(doc.filename).pages), len(pages[0]))
+                    self.assertGreater(len(pages[0]), 1)
+                    self.assertEqual(pages[0], pages[1])
+
+    @unittest.skipIf(PdfReader is None, 'pypdf is not installed')
+    def test_reserved_toc(self):
+        # the table of contents filled after the layout has the pages it would have after more passes
+        with tempfile.TemporaryDirectory() as directory:
+            # a table of contents over more than one page
+            filename = generate(directory, 'g19', Size(chapters=30, tables=0, rows=0, images=0, list_depth=1,
+                                                      paragraphs=1))
+            pages, passes = [], []
+            for reserve in (False, True):
+                doc = SimplePDFCreate().load(filename)
+                doc.reserve_toc = reserve
+                reader = PdfReader(io.BytesIO(doc.save_bytes()))
+                pages.append([sorted(page.extract_text().split()) for page in reader.pages])
+                passes.append(doc.passes)
+        self.assertEqual(pages[0], pages[1])
+        self.assertLess(passes[1], passes[0])
+
+    @unittest.skipIf(PdfReader is None, 'pypdf is not installed')
+    def test_page_count(self):
+        # the page count of the title block is drawn when the document is closed, not by another pass
+        with tempfile.TemporaryDirectory() as directory:
+            for standard, page in (('g2', 1), ('g19', 0)):
+                with self.subTest(standard=standard):
+                    doc = SimplePDFCreate().load(generate(directory, standard, SIZES['small']))
+                    reader = PdfReader(io.BytesIO(doc.save_bytes()))
+                    self.assertEqual(doc.passes, 1)
+                    self.assertEqual(doc.page_count, len(reader.pages))
+                    self.assertIn(str(doc.page_count), reader.pages[page].extract_text().split())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.generate import SIZES, generate
+from spc.batch import build_batch, expand_projects
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.good = generate(self.directory.name, 'simple', SIZES['small'])
+        self.broken = os.path.join(self.directory.name, 'broken.yaml')
+        with open(self.broken, 'w', encoding='utf-8') as file:
+            file.write('spc: [not: a project\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_expand_projects(self):
+        # a pattern without matches is kept, so it is reported as failed
+        pattern = os.path.join(self.directory.name, '*.yaml')
+        missing = os.path.join(self.directory.name, 'missing*.yaml')
+        self.assertEqual(expand_projects([pattern, self.good, missing]),
+                         sorted([self.broken, self.good]) + [missing])
+
+    def test_failed_project(self):
+        # a broken project does not stop the others
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                reported = []
+                results = build_batch([self.broken, self.good], jobs, reported.append)
+                self.assertEqual([result.filename for result in results], [self.broken, self.good])
+                self.assertFalse(results[0].ok)
+                self.assertTrue(results[1].ok)
+                self.assertGreater(results[1].pages, 0)
+                self.assertTrue(os.path.getsize(results[1].output))
+                self.assertEqual(len(reported), 2)
+
+    def test_exit_status(self):
+        env = dict(os.environ, PYTHONPATH=str(ROOT))
+        run = subprocess.run([sys.executable, str(ROOT / 'spc_cmd' / 'main.py'), '--batch', self.broken, self.good,
+                              '--jobs', '1'], capture_output=True, text=True, env=env, cwd=self.directory.name)
+        self.assertEqual(run.returncode, 1)
+        self.assertIn(f'{self.broken}: FAILED', run.stdout)
+        self.assertIn('done: 1 built, 1 failed', run.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from benchmarks.generate import SIZES, generate
+from spc.core import SimplePDFCreate
+from spc.events import Events
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class EventsTestCase(unittest.TestCase):
+    def test_phase(self):
+        events = []
+        with self.assertRaises(ValueError):
+            with Events(events.append).phase('outer', filename='a.yaml'):
+                with Events(events.append).phase('inner'):
+                    time.sleep(0.02)
+                raise ValueError
+        self.assertEqual([(event.kind, event.name) for event in events],
+                         [('phase_start', 'outer'), ('phase_start', 'inner'),
+                          ('phase_end', 'inner'), ('phase_end', 'outer')])
+        self.assertEqual(events[-1].filename, 'a.yaml')
+        self.assertGreaterEqual(events[2].elapsed, 0.02)
+        self.assertGreaterEqual(events[3].elapsed, events[2].elapsed)
+
+    def test_build(self):
+        # the phases of a build are nested and every one that starts ends
+        events = []
+        with tempfile.TemporaryDirectory() as directory:
+            SimplePDFCreate(events.append).load(generate(directory, 'g2', SIZES['small'])).save()
+        started = []
+        for event in events:
+            if event.kind == 'phase_start':
+                started.append(event.name)
+            elif event.kind == 'phase_end':
+                self.assertEqual(started.pop(), event.name)
+                self.assertGreaterEqual(event.elapsed, 0)
+        self.assertEqual(started, [])
+        phases = [event.name for event in events if event.kind == 'phase_end']
+        self.assertEqual(phases[-2:], ['prepare', 'build'])
+        self.assertIn('pass', [event.kind for event in events])
+        self.assertIn('page', [event.kind for event in events])
+
+    def test_silent(self):
+        # without a callback the library prints nothing
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(output):
+            SimplePDFCreate().load(generate(directory, 'g2', SIZES['small'])).save()
+        self.assertEqual(output.getvalue(), '')
+
+    def test_noprogress(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = generate(directory, 'g2', SIZES['small'])
+            env = dict(os.environ, PYTHONPATH=str(ROOT))
+            outputs = []
+            for flags in ([], ['--noprogress']):
+                run = subprocess.run([sys.executable, str(ROOT / 'spc_cmd' / 'main.py'), '--filename', filename,
+                                      *flags], capture_output=True, text=True, env=env)
+                self.assertEqual(run.returncode, 0, run.stderr)
+                self.assertEqual(run.stderr, '')
+                outputs.append(run.stdout.splitlines())
+        self.assertIn('pass 1', outputs[0])
+        # only the summary is left
+        self.assertEqual(len(outputs[1]), 1)
+        self.assertTrue(outputs[1][0].startswith('done: '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfbase.ttfonts import TTFont
+
+from spc import fonts
+
+FONT = os.path.join(os.path.dirname(__file__), '..', 'font', 'Times New Roman.ttf')
+
+
+class FontRegistryTestCase(unittest.TestCase):
+    def test_register_once(self):
+        font = fonts.register_font('Times New Roman', FONT)
+        self.assertIs(font, fonts.register_font('Times New Roman', FONT))
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {'SPC_CACHE_DIR': directory}):
+                parsed = fonts.load_font('spc-parsed', FONT)
+                cached = fonts.load_font('spc-cached', FONT)
+                self.assertEqual(len(os.listdir(os.path.join(directory, 'fonts'))), 1)
+        self.assertEqual(parsed.face.charWidths, cached.face.charWidths)
+        fonts.register_font('spc-cached', FONT)
+        self.assertEqual(stringWidth('Листов', 'spc-cached', 12), parsed.stringWidth('Листов', 12))
+
+    def test_round_trip(self):
+        # a font restored from the cache measures, subsets and behaves as one reportlab parses itself
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {'SPC_CACHE_DIR': directory}):
+                fonts.load_font('spc-parsed', FONT)
+                cached = fonts.load_font('spc-round-trip', FONT)
+        fresh = TTFont('spc-round-trip', FONT)
+        for text in ('Листов', 'Times New Roman 123'):
+            self.assertEqual(cached.stringWidth(text, 12), fresh.stringWidth(text, 12))
+        subset = [ord(char) for char in 'Протокол испытаний 0123']
+        self.assertEqual(cached.face.makeSubset(subset), fresh.face.makeSubset(subset))
+        self.assertEqual((cached._asciiReadable, cached.shapable), (fresh._asciiReadable, fresh.shapable))
+        self.assertEqual(set(vars(cached)), set(vars(fresh)))
+        self.assertEqual(set(vars(cached.face)), set(vars(fresh.face)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from spc import images
+
+
+class ImagesTestCase(unittest.TestCase):
+    def test_prepare(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(os.environ, {'SPC_CACHE_DIR': directory}):
+            big = os.path.join(directory, 'big.jpg')
+            Image.new('RGB', (3000, 1500), 'blue').save(big)
+            prepared = images.prepare(big, (500, 700), dpi=144)
+            self.assertEqual((prepared.width, prepared.height), (500, 250))
+            with Image.open(prepared.filename) as image:
+                self.assertEqual(image.size, (1000, 500))
+            self.assertEqual(images.prepare(big, (500, 700), dpi=144).filename, prepared.filename)
+
+            small = os.path.join(directory, 'small.png')
+            copy = os.path.join(directory, 'copy.png')
+            Image.new('RGB', (100, 50), 'red').save(small)
+            shutil.copy(small, copy)
+            # an image that is not resampled is read from the file the project refers to
+            self.assertEqual(images.prepare(copy, (500, 700)).filename, copy)
+            os.remove(small)
+            self.assertEqual(images.prepare(copy, (500, 700)).filename, copy)
+
+    def test_bounded(self):
+        # a long-lived worker keeps only the last images it has seen
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(os.environ, {'SPC_CACHE_DIR': directory}), \
+                mock.patch.object(images, 'CACHE_SIZE', 3), \
+                mock.patch.object(images, '_pending', images.OrderedDict()):
+            names = []
+            for index in range(5):
+                names.append(os.path.join(directory, f'{index}.png'))
+                Image.new('RGB', (10, 10), (index, 0, 0)).save(names[-1])
+            first = images.prefetch(names[0])
+            for name in names:
+                images.load(name)
+                images.prefetch(names[0])
+            self.assertIs(images.prefetch(names[0]), first)
+            self.assertEqual(len(images._pending), 3)
+            self.assertNotIn(images._key(names[1], None), images._pending)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import subprocess
+import sys
+import unittest
+
+# modules a plain `import spc` must not pull in, they are imported when a project needs them
+LAZY = ('mistletoe', 'pydantic_yaml', 'json_schema_for_humans', 'spc.standard.g105', 'spc.standard.g105_no_border',
+        'spc.standard.g19', 'spc.standard.simple')
+
+
+def imported(code):
+    output = subprocess.run([sys.executable, '-c', f'{code}\nimport sys\nprint(" ".join(sys.modules))'],
+                            capture_output=True, text=True, check=True).stdout
+    return set(output.split())
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_lazy(self):
+        modules = imported('import spc')
+        self.assertEqual([name for name in LAZY if name in modules], [])
+
+    def test_standard(self):
+        modules = imported('import spc\nspc.SimplePDFCreate().standards["g2"]["doc"]')
+        self.assertIn('spc.standard.g105', modules)
+        self.assertNotIn('spc.standard.g19', modules)
+        self.assertNotIn('mistletoe', modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
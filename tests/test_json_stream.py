@@ -0,0 +1,32 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from spc import json_stream
+
+
+class JSONStreamTestCase(unittest.TestCase):
+    def test_load_object(self):
+        data = {
+            'data': [[i, 1.5 * i, f'строка {i}', None, True] for i in range(1000)],
+            'header': 'Header text',
+            'span': [{'start': [0, 0], 'end': [1, 0]}],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'table.json')
+            with open(filename, 'w', encoding='utf-8') as file:
+                json.dump(data, file, ensure_ascii=False, indent=1)
+            # values cut at every chunk border
+            with mock.patch.object(json_stream, 'CHUNK_SIZE', 7):
+                loaded = json_stream.load_object(filename, streamed=('data',))
+                self.assertEqual(len(loaded['data']), 1000)
+                self.assertEqual(list(loaded['data']), data['data'])
+                self.assertEqual(list(loaded['data']), data['data'])
+            self.assertEqual(loaded['header'], data['header'])
+            self.assertEqual(loaded['span'], data['span'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from reportlab.platypus import PageBreak
+
+from spc.standard.macros import MacroRegistry, macros
+
+
+class MacrosTestCase(unittest.TestCase):
+    def test_expand(self):
+        labels = {'a': 1, 'b': 2}
+        text = macros.expand('see %ref(a) and %ref(b), %ref(a) %label(c)', labels.get)
+        self.assertEqual(text, 'see <a href="#a">1</a> and <a href="#b">2</a>, <a href="#a">1</a> <a name="c"/>')
+        self.assertEqual(macros.expand('%ref(a)'), '%ref(a)')
+
+    def test_blocks(self):
+        breaks = macros.blocks('%landscape')
+        self.assertEqual(len(breaks), 1)
+        self.assertIsInstance(breaks[0], PageBreak)
+        self.assertEqual(macros.blocks('100% text'), [])
+
+    def test_register(self):
+        registry = MacroRegistry()
+        registry.register('ref', lambda label, on_replace: label.upper())
+        registry.register('year', lambda argument, on_replace: '2024')
+        self.assertEqual(registry.expand('%ref(x) %year'), 'X 2024')
+        self.assertEqual(registry.find('caption %label(t1)', 'label'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
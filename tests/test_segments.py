@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.generate import Size, generate
+from spc.core import SimplePDFCreate
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+
+@unittest.skipIf(PdfReader is None, 'pypdf is not installed')
+class SegmentsTestCase(unittest.TestCase):
+    def build(self, filename, jobs):
+        doc = SimplePDFCreate().load(filename)
+        doc.save(jobs)
+        reader = PdfReader(doc.filename)
+        # the page numbers are drawn over the merged pages, their text comes in another order
+        return doc, [sorted(page.extract_text().split()) for page in reader.pages], reader
+
+    def test_same_as_serial(self):
+        # appendixes make segments, the table of contents and the links point across them
+        with tempfile.TemporaryDirectory() as directory:
+            for standard in ('g2', 'g19'):
+                with self.subTest(standard=standard):
+                    filename = generate(directory, standard, Size(chapters=2, tables=1, rows=20, images=1,
+                                                                  list_depth=2, appendixes=3))
+                    serial, serial_pages, _ = self.build(filename, None)
+                    shutil.move(serial.filename, serial.filename + '.serial')
+                    doc, pages, reader = self.build(filename, 2)
+                    self.assertEqual(doc.page_count, serial.page_count)
+                    self.assertEqual(pages, serial_pages)
+                    self.assertEqual([item['/Title'] for item in reader.outline if isinstance(item, dict)],
+                                     [item['/Title'] for item in PdfReader(serial.filename + '.serial').outline
+                                      if isinstance(item, dict)])
+                    self.assertTrue(os.path.getsize(doc.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import base64
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+from unittest import mock
+from urllib.error import HTTPError
+
+from benchmarks.generate import SIZES, generate
+from spc import fonts
+from spc.core import SimplePDFCreate
+from spc.server import _warm, default_fonts, project_fonts, serve
+
+
+class ServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        ready = threading.Event()
+
+        def on_ready(server):
+            cls.server = server
+            ready.set()
+
+        threading.Thread(target=serve, kwargs={'port': 0, 'workers': 1, 'on_ready': on_ready}, daemon=True).start()
+        ready.wait(60)
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def post(self, job):
+        request = urllib.request.Request(f'{self.url}/render', json.dumps(job).encode('utf-8'),
+                                         {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return response.headers, response.read()
+
+    def test_project(self):
+        with tempfile.TemporaryDirectory() as directory:
+            headers, body = self.post({'project': generate(directory, 'g2', SIZES['small'])})
+            result = json.loads(body)
+            self.assertTrue(os.path.getsize(result['output']))
+            self.assertGreater(result['pages'], 1)
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = generate(directory, 'simple', SIZES['small'])
+            with open(filename, encoding='utf-8') as file:
+                project = file.read()
+            files = {}
+            for name in os.listdir(directory):
+                if not name.endswith('.yaml'):
+                    with open(os.path.join(directory, name), 'rb') as file:
+                        files[name] = base64.b64encode(file.read()).decode('ascii')
+        headers, body = self.post({'yaml': project, 'files': files})
+        self.assertEqual(headers['Content-Type'], 'application/pdf')
+        self.assertTrue(body.startswith(b'%PDF'))
+
+    def test_bad_job(self):
+        with self.assertRaises(HTTPError) as error:
+            self.post({'yaml': '', 'files': {'../outside.md': ''}})
+        self.assertEqual(error.exception.code, 400)
+        with self.assertRaises(HTTPError) as error:
+            self.post({'project': '/nonexistent/project.yaml'})
+        self.assertEqual(error.exception.code, 422)
+        for job in ([], 'project', {'yaml': '', 'files': []}, {'yaml': 5}, {'project': 5},
+                    {'yaml': '', 'files': {'a.md': 5}}):
+            with self.subTest(job=job):
+                with self.assertRaises(HTTPError) as error:
+                    self.post(job)
+                self.assertEqual(error.exception.code, 400)
+
+    def test_warm(self):
+        # a project using the fonts of font/ finds them registered by the warm-up
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(fonts._registered, clear=True):
+            font = default_fonts()
+            self.assertEqual(font.family, 'Times New Roman')
+            self.assertEqual(sorted(item.type for item in font.fonts), ['bold', 'italic', 'normal'])
+            _warm(font)
+            filename = generate(directory, 'g2', SIZES['small'])
+            self.assertEqual(project_fonts(filename).fonts[0].filename,
+                             os.path.join(os.path.realpath(directory), 'Times New Roman.ttf'))
+            with mock.patch.object(fonts, 'load_font', side_effect=AssertionError('loaded again')):
+                SimplePDFCreate().load(filename).save()
+
+
+if __name__ == '__main__':
+    unittest.main()
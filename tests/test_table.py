@@ -0,0 +1,119 @@
+import io
+import unittest
+
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import SimpleDocTemplate, Table, Paragraph
+
+from spc.standard.doc import SPCTable, ChunkedTable, FlowableStream, MeasuredTable, TextWidths
+
+
+class ChunkedTableTestCase(unittest.TestCase):
+    def make_table(self, rows):
+        table = SPCTable(['n', 'color', 'group'], 1, ['str', 'color', 'span'])
+        for i in range(rows):
+            table.append([str(i), 'yellow', f'group {i // 3}'])
+        return table
+
+    def test_small_table(self):
+        flowables = self.make_table(SPCTable.chunk_threshold).build('Helvetica', 10)
+        self.assertIsInstance(flowables[0], Table)
+
+    def test_build_again(self):
+        # every build pass makes the flowables of the items again
+        table = self.make_table(10)
+        first, second = table.build('Helvetica', 10)[0], table.build('Helvetica', 10)[0]
+        self.assertTrue(first._bkgrndcmds)
+        self.assertEqual(first._bkgrndcmds, second._bkgrndcmds)
+
+    def test_stream(self):
+        def flowables():
+            heading = ParagraphStyle('heading', fontSize=14, keepWithNext=1)
+            for i in range(20):
+                yield Paragraph(f'heading {i}', heading)
+                yield from self.make_table(30 + i).build('Helvetica', 10)
+
+        pages = []
+        for story in (list(flowables()), FlowableStream(flowables())):
+            doc = SimpleDocTemplate(io.BytesIO())
+            drawn = []
+            doc.afterFlowable = lambda flowable: drawn.append((doc.page, flowable.__class__.__name__))
+            doc.build(story)
+            pages.append(drawn)
+        self.assertEqual(pages[0], pages[1])
+
+    def test_runs(self):
+        # adjacent equal colour and span cells get one style command per run
+        table = SPCTable(['n', 'color', 'group'], 1, ['str', 'color', 'span'])
+        colors = ['yellow'] * 3 + ['green'] * 2 + ['yellow'] + ['none'] * 2
+        groups = ['g1'] * 3 + ['g2'] + ['g3'] * 4
+        for i, (color, group) in enumerate(zip(colors, groups)):
+            table.append([str(i), color, group])
+        flowable = table.build('Helvetica', 10)[0]
+        self.assertEqual([(command[0], command[1], command[2]) for command in flowable._bkgrndcmds],
+                         [('BACKGROUND', (1, 1), (1, 3)), ('BACKGROUND', (1, 4), (1, 5)),
+                          ('BACKGROUND', (1, 6), (1, 6))])
+        # the single g2 cell gets no command
+        self.assertEqual(flowable._spanCmds, [('SPAN', (2, 1), (2, 3)), ('SPAN', (2, 5), (2, 8))])
+        self.assertEqual([row[1] for row in flowable._cellvalues[1:]], [''] * 8)
+
+    def test_chunked_table(self):
+        flowables = self.make_table(2000).build('Helvetica', 10)
+        self.assertIsInstance(flowables[0], ChunkedTable)
+
+        drawn = []
+        doc = SimpleDocTemplate(io.BytesIO())
+        doc.afterFlowable = lambda flowable: drawn.append(flowable)
+        doc.build(flowables)
+        tables = [flowable for flowable in drawn if isinstance(flowable, Table)]
+        self.assertGreater(len(tables), 10)
+        rows = [row[0] for table in tables for row in table._cellvalues[1:]]
+        self.assertEqual(rows, [str(i) for i in range(2000)])
+
+    def test_column_formats(self):
+        table = SPCTable(['n', 'color', 'group', 'text'], 1, ['30mm', 'color:2*', 'span:25%', 'auto2'])
+        for i in range(10):
+            table.append([str(i), 'yellow', f'group {i // 3}', 'long text ' * 10 if i > 2 else 'short'])
+        table.set_caption('Results %widths(30mm,2*,1*,auto2) %label(results)')
+        self.assertEqual((table.caption, table.label), ('Results ', 'results'))
+        widths = table.build('Helvetica', 10)[0]._argW
+        self.assertAlmostEqual(widths[0], 30 * mm)
+        self.assertEqual(widths[1:3], [f'{200 / 3}%', f'{100 / 3}%'])
+        # only the header and the first two rows are measured
+        self.assertEqual(widths[3], stringWidth('short', 'Helvetica', 10) + 12)
+
+    def test_unknown_column_formats(self):
+        # formats of other tools were ignored before the widths, they still are
+        with self.assertLogs('spc', 'WARNING'):
+            table = SPCTable(['n', 'date', 'color'], 1, ['int', 'date', 'color:wide'])
+        table.append(['1', '2024-01-01', 'yellow'])
+        flowable = table.build('Helvetica', 10)[0]
+        self.assertEqual(flowable._argW, [None, None, None])
+        self.assertTrue(flowable._bkgrndcmds)
+
+        # not a string at all
+        with self.assertLogs('spc', 'WARNING') as logs:
+            table = SPCTable(['n', 'list', 'color'], 1, [5, ['str'], 'color'])
+        self.assertEqual(len(logs.output), 2)
+        table.append(['1', 'a', 'yellow'])
+        self.assertEqual(table.build('Helvetica', 10)[0]._argW, [None, None, None])
+
+    def test_text_widths(self):
+        # the same page as a plain table, with every cell text measured once for all passes
+        style = ParagraphStyle('cell', fontSize=10)
+        data = [['n', 'two\nlines', Paragraph('a <b>bold</b> word', style)]] + \
+               [[str(i % 5), 'a\nb', Paragraph('a <b>bold</b> word', style)] for i in range(60)]
+        pages = []
+        for cls in (Table, MeasuredTable):
+            output = io.BytesIO()
+            doc = SimpleDocTemplate(output, invariant=1)
+            doc.text_widths = TextWidths()
+            doc.build([cls([row[:] for row in data], style=[('ALIGN', (0, 0), (-1, -1), 'CENTER')])])
+            pages.append(output.getvalue())
+        self.assertEqual(pages[0], pages[1])
+        self.assertEqual(len(doc.text_widths), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()